@@ -4,8 +4,19 @@
 
 
 import sqlite3
-import matplotlib.pyplot as plt
+import argparse
+import contextlib
+import csv
 import datetime
+import inspect
+import json
+import os
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 
 ##################################################################
 #
@@ -23,70 +34,705 @@ def formatInt(val):
 
 ##################################################################
 #
-# print_stats
+# connect
 #
-# Executes SQL queries to retrieve and display the initial stats.
-def print_stats(dbConn):
+# Opens the database with a connection that remembers facts about it
+# (which search indexes it has) in its .info dict, so they are looked
+# up once instead of on every command. Any sqlite3 connection works
+# with the commands; connection_info() just hands out a new, empty
+# dict for other connections, so nothing is remembered for them.
+#
+class _InfoConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.info = {}
+
+
+def connect(dbName, **kwargs):
+    return sqlite3.connect(dbName, factory=_InfoConnection, **kwargs)
+
+
+def connection_info(dbConn):
+    if isinstance(dbConn, _InfoConnection):
+        return dbConn.info
+    return {}
+
+
+##################################################################
+#
+# Plotting
+#
+# matplotlib is only imported the first time a plot is drawn, so
+# sessions that never plot do not pay for it. By default plots are
+# shown on screen; once PLOT_SETTINGS["dir"] is set (--plot-dir) the
+# Agg backend is used and each plot is written to a PNG or SVG file in
+# that directory instead, which works on machines with no display.
+#
+PLOT_SETTINGS = {"dir": None, "format": "png"}
+
+_pyplot = None
+
+
+def get_pyplot():
+    global _pyplot
+    if _pyplot is None:
+        import matplotlib
+        if PLOT_SETTINGS["dir"] is not None:
+            matplotlib.use("Agg")
+        import matplotlib.pyplot
+        _pyplot = matplotlib.pyplot
+    return _pyplot
+
+
+##################################################################
+#
+# show_plot
+#
+# Shows the current figure, or in headless mode saves it as
+# <name>.<format> in the plot directory and closes it. Returns the
+# file written, or None if the plot was shown.
+#
+def show_plot(plt, name):
+    if PLOT_SETTINGS["dir"] is None:
+        plt.show()
+        return None
+    safeName = re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+    path = os.path.join(PLOT_SETTINGS["dir"], f"{safeName}.{PLOT_SETTINGS['format']}")
+    plt.savefig(path)
+    plt.close()
+    print(f"Plot saved to {path}")
+    return path
+
+
+##################################################################
+#
+# Helper function: year_date_range
+#
+# Returns the half-open [start, end) range of Violation_Date values
+# that fall in the given year, e.g. "2018" -> ("2018-01-01", "2019-01-01").
+# Filtering with Violation_Date >= start AND Violation_Date < end
+# matches the same rows as strftime('%Y', Violation_Date) = year, but
+# can be answered by a range scan on a Violation_Date index. Input that
+# is not a 4-digit year gets an empty range, so nothing matches.
+#
+def year_date_range(userYear):
+    if len(userYear) != 4 or not userYear.isdigit():
+        return ("", "")
+    return (f"{userYear}-01-01", f"{int(userYear) + 1:04d}-01-01")
+
+
+##################################################################
+#
+# Change tracking
+#
+# Data_Changes keeps two counters per tracked table, maintained by
+# AFTER INSERT / UPDATE / DELETE triggers on it: Change_Count goes up
+# on every row change, Rewrite_Count only on updates and deletes. Data
+# derived from a table (the rollups, the stats snapshot) remembers the
+# Change_Count it was computed at and is current only while the two
+# are equal -- unlike MAX(rowid), this also notices deleted rows whose
+# rowids get reused.
+#
+CHANGE_TRACKED_TABLES = ["RedCameras", "SpeedCameras", "RedViolations", "SpeedViolations"]
+
+
+def create_change_tracking(dbConn):
     dbCursor = dbConn.cursor()
-    
-    # 1) Number of Red Light Cameras:
+    dbCursor.execute("""
+    CREATE TABLE IF NOT EXISTS Data_Changes (
+        Source_Table TEXT PRIMARY KEY,
+        Change_Count INTEGER NOT NULL DEFAULT 0,
+        Rewrite_Count INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    for table in CHANGE_TRACKED_TABLES:
+        dbCursor.execute("INSERT OR IGNORE INTO Data_Changes (Source_Table) VALUES (?);", [table])
+        dbCursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_Changes_Insert AFTER INSERT ON {table}
+        BEGIN
+            UPDATE Data_Changes SET Change_Count = Change_Count + 1
+            WHERE Source_Table = '{table}';
+        END;
+        """)
+        for event in ["UPDATE", "DELETE"]:
+            dbCursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_Changes_{event.title()} AFTER {event} ON {table}
+            BEGIN
+                UPDATE Data_Changes SET Change_Count = Change_Count + 1,
+                                        Rewrite_Count = Rewrite_Count + 1
+                WHERE Source_Table = '{table}';
+            END;
+            """)
+
+
+# Returns (Change_Count, Rewrite_Count) for the given table, or None if
+# it is not tracked (e.g. a read-only database that was never prepared).
+def _change_counts(dbCursor, table):
+    try:
+        dbCursor.execute("""
+        SELECT Change_Count, Rewrite_Count FROM Data_Changes WHERE Source_Table = ?;
+        """, [table])
+    except sqlite3.Error:
+        # Data_Changes has never been created
+        return None
+    return dbCursor.fetchone()
+
+
+##################################################################
+#
+# Violation rollups
+#
+# Per-camera daily, monthly and yearly totals of Num_Violations are
+# materialized into <table>_Daily, <table>_Monthly and <table>_Yearly
+# for both RedViolations and SpeedViolations. The rollups keep the
+# same (Camera_ID, Violation_Date, Num_Violations) columns as the raw
+# tables -- monthly rows are dated YYYY-MM-01 and yearly rows YYYY-01-01 --
+# so every command query runs unchanged against either one. Rows with
+# a NULL Camera_ID or date are rolled up too, so the totals agree with
+# the raw tables.
+#
+# Violation_Rollups remembers, per raw table, the change counters the
+# rollups were built at and the highest rowid folded into them. A
+# rollup counts as current only while its Change_Count equals the raw
+# table's; otherwise the commands fall back to the raw tables.
+#
+VIOLATION_TABLES = ["RedViolations", "SpeedViolations"]
+
+# grain -> expression that maps a raw Violation_Date onto the rollup date
+ROLLUP_GRAINS = {
+    "Daily": "Violation_Date",
+    "Monthly": "strftime('%Y-%m-01', Violation_Date)",
+    "Yearly": "strftime('%Y-01-01', Violation_Date)",
+}
+
+
+def create_rollup_tables(dbConn):
+    dbCursor = dbConn.cursor()
+    dbCursor.execute("SELECT name FROM pragma_table_info('Violation_Rollups');")
+    columns = [row[0] for row in dbCursor.fetchall()]
+    if len(columns) > 0 and "Change_Count" not in columns:
+        # rollups from before change tracking: start over
+        dbCursor.execute("DROP TABLE Violation_Rollups;")
+        for table in VIOLATION_TABLES:
+            for grain in ROLLUP_GRAINS:
+                dbCursor.execute(f"DROP TABLE IF EXISTS {table}_{grain};")
+    dbCursor.execute("""
+    CREATE TABLE IF NOT EXISTS Violation_Rollups (
+        Source_Table TEXT PRIMARY KEY,
+        Change_Count INTEGER NOT NULL,
+        Rewrite_Count INTEGER NOT NULL,
+        Last_RowID INTEGER NOT NULL
+    );
+    """)
+    dbCursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'Data_Changes';")
+    if dbCursor.fetchone()[0] == 0:
+        # counters (re)start at 0, so nothing built before can be trusted
+        dbCursor.execute("DELETE FROM Violation_Rollups;")
+    create_change_tracking(dbConn)
+    for table in VIOLATION_TABLES:
+        for grain in ROLLUP_GRAINS:
+            # Camera_ID and Violation_Date may be NULL, so this is not a
+            # WITHOUT ROWID table; NULL keys never conflict, which only
+            # means their totals can be split over several rows.
+            dbCursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table}_{grain} (
+                Camera_ID INTEGER,
+                Violation_Date TEXT,
+                Num_Violations INTEGER,
+                UNIQUE (Camera_ID, Violation_Date)
+            );
+            """)
+            dbCursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {table}_{grain}_Date
+            ON {table}_{grain} (Violation_Date);
+            """)
+
+
+def _max_rowid(dbCursor, table):
+    dbCursor.execute(f"SELECT MAX(rowid) FROM {table};")
+    maxRowID = dbCursor.fetchone()[0]
+    if maxRowID is None:
+        return 0
+    return maxRowID
+
+
+##################################################################
+#
+# refresh_rollups
+#
+# Brings the daily, monthly and yearly rollups up to date, creating
+# the rollup tables and change tracking on first use. If the only
+# changes since the last refresh are rows appended past its highest
+# rowid, just those rows are folded in; after any update or delete
+# (or an insert that reused an old rowid) the rollups for that table
+# are rebuilt from scratch. Returns True on success; if the rollups
+# cannot be written (e.g. a read-only database), returns False and the
+# commands keep reading the raw tables.
+#
+def refresh_rollups(dbConn):
+    try:
+        create_rollup_tables(dbConn)
+        dbCursor = dbConn.cursor()
+        if not dbConn.in_transaction:
+            # keep writers out between reading the counters and the rows
+            dbCursor.execute("BEGIN IMMEDIATE;")
+        for table in VIOLATION_TABLES:
+            changeCount, rewriteCount = _change_counts(dbCursor, table)
+            dbCursor.execute("""
+            SELECT Change_Count, Rewrite_Count, Last_RowID
+            FROM Violation_Rollups
+            WHERE Source_Table = ?;
+            """, [table])
+            built = dbCursor.fetchone()
+            if built is not None and built[0] == changeCount:
+                continue
+            maxRowID = _max_rowid(dbCursor, table)
+            lastRowID = 0
+            if built is not None and built[1] == rewriteCount:
+                # only inserts since the last refresh -- were they all appended?
+                dbCursor.execute(f"SELECT COUNT(*) FROM {table} WHERE rowid > ?;", [built[2]])
+                if dbCursor.fetchone()[0] == changeCount - built[0]:
+                    lastRowID = built[2]
+            if lastRowID == 0:
+                for grain in ROLLUP_GRAINS:
+                    dbCursor.execute(f"DELETE FROM {table}_{grain};")
+            if maxRowID > lastRowID:
+                for grain, dateExpr in ROLLUP_GRAINS.items():
+                    dbCursor.execute(f"""
+                    INSERT INTO {table}_{grain} (Camera_ID, Violation_Date, Num_Violations)
+                    SELECT Camera_ID, {dateExpr} AS RollupDate, SUM(Num_Violations)
+                    FROM {table}
+                    WHERE rowid > ? AND rowid <= ?
+                    GROUP BY Camera_ID, RollupDate
+                    ON CONFLICT (Camera_ID, Violation_Date)
+                    DO UPDATE SET Num_Violations = COALESCE(Num_Violations + excluded.Num_Violations,
+                                                            Num_Violations, excluded.Num_Violations);
+                    """, [lastRowID, maxRowID])
+            dbCursor.execute("""
+            INSERT INTO Violation_Rollups (Source_Table, Change_Count, Rewrite_Count, Last_RowID)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (Source_Table) DO UPDATE
+            SET Change_Count = excluded.Change_Count,
+                Rewrite_Count = excluded.Rewrite_Count,
+                Last_RowID = excluded.Last_RowID;
+            """, [table, changeCount, rewriteCount, maxRowID])
+        dbConn.commit()
+        return True
+    except sqlite3.Error as e:
+        dbConn.rollback()
+        print("Violation rollups unavailable, using raw tables:", e)
+        return False
+
+
+##################################################################
+#
+# rebuild_rollups
+#
+# Discards the rollups and rebuilds them from the raw violation tables.
+#
+def rebuild_rollups(dbConn):
+    try:
+        create_rollup_tables(dbConn)
+        dbConn.execute("DELETE FROM Violation_Rollups;")
+    except sqlite3.Error as e:
+        dbConn.rollback()
+        print("Violation rollups unavailable, using raw tables:", e)
+        return False
+    return refresh_rollups(dbConn)
+
+
+##################################################################
+#
+# rollup_is_current
+#
+# True if the rollups for the given raw violation table were built at
+# its current change count, i.e. nothing has changed in it since.
+#
+def rollup_is_current(dbConn, table):
+    dbCursor = dbConn.cursor()
+    try:
+        dbCursor.execute("""
+        SELECT R.Change_Count = C.Change_Count
+        FROM Violation_Rollups R
+        JOIN Data_Changes C ON C.Source_Table = R.Source_Table
+        WHERE R.Source_Table = ?;
+        """, [table])
+    except sqlite3.Error:
+        # Violation_Rollups has never been created
+        return False
+    row = dbCursor.fetchone()
+    return row is not None and row[0] == 1
+
+
+##################################################################
+#
+# violation_source
+#
+# Returns the table a command should read the given violation table
+# from at the given grain ("Daily", "Monthly" or "Yearly"): the rollup
+# if it is current, otherwise the raw table itself.
+#
+def violation_source(dbConn, table, grain):
+    if rollup_is_current(dbConn, table):
+        return f"{table}_{grain}"
+    return table
+
+
+##################################################################
+#
+# create_violation_indexes
+#
+# Makes sure both violation tables have a (Violation_Date) index for
+# the per-date and per-year commands and a (Camera_ID, Violation_Date)
+# index for the per-camera commands. Returns False if the indexes
+# cannot be created (e.g. a read-only database).
+#
+def create_violation_indexes(dbConn):
+    try:
+        dbCursor = dbConn.cursor()
+        for table in VIOLATION_TABLES:
+            dbCursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {table}_Date
+            ON {table} (Violation_Date);
+            """)
+            dbCursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {table}_Camera_Date
+            ON {table} (Camera_ID, Violation_Date);
+            """)
+        dbConn.commit()
+        return True
+    except sqlite3.Error as e:
+        dbConn.rollback()
+        print("Violation indexes unavailable:", e)
+        return False
+
+
+##################################################################
+#
+# General statistics snapshot
+#
+# The numbers printed by print_stats are computed in one pass per table
+# (COUNT, MIN/MAX date and SUM together) and saved in the single-row
+# Stats_Snapshot table along with the data version they were computed
+# at. The data version is the Change_Count of each of the four tables
+# (see Change tracking), so any insert, update or delete changes it.
+# Without change tracking (a database that was never prepared) the
+# numbers are recomputed every time.
+#
+STATS_TABLES = CHANGE_TRACKED_TABLES
+
+STATS_COLUMNS = ["Red_Cameras", "Speed_Cameras", "Red_Entries", "Speed_Entries",
+                 "Min_Date", "Max_Date", "Red_Total", "Speed_Total"]
+
+
+def stats_data_version(dbConn):
+    dbCursor = dbConn.cursor()
+    parts = []
+    for table in STATS_TABLES:
+        counts = _change_counts(dbCursor, table)
+        if counts is None:
+            return None
+        parts.append(f"{table}={counts[0]}")
+    return ";".join(parts)
+
+
+def _compute_stats(dbConn):
+    dbCursor = dbConn.cursor()
+
     dbCursor.execute("SELECT COUNT(*) FROM RedCameras;")
     redCamCount = dbCursor.fetchone()[0]
 
-    # 2) Number of Speed Cameras:
     dbCursor.execute("SELECT COUNT(*) FROM SpeedCameras;")
     speedCamCount = dbCursor.fetchone()[0]
-    
-    # 3) Number of Red Light Camera Violation Entries:
-    dbCursor.execute("SELECT COUNT(*) FROM RedViolations;")
-    redViolationsCount = dbCursor.fetchone()[0]
-    
-    # 4) Number of Speed Camera Violation Entries:
-    dbCursor.execute("SELECT COUNT(*) FROM SpeedViolations;")
-    speedViolationsCount = dbCursor.fetchone()[0]
-
-    # 5) Find min & max date across both RedViolations and SpeedViolations:
-    dbCursor.execute("SELECT MIN(Violation_Date), MAX(Violation_Date) FROM RedViolations;")
-    rminmax = dbCursor.fetchone()
-    dbCursor.execute("SELECT MIN(Violation_Date), MAX(Violation_Date) FROM SpeedViolations;")
-    sminmax = dbCursor.fetchone()
-    # Handle possible None values (if any table is empty).
-    minDates = []
-    maxDates = []
-    if rminmax[0] is not None: 
-        minDates.append(rminmax[0])
-    if rminmax[1] is not None:
-        maxDates.append(rminmax[1])
-    if sminmax[0] is not None:
-        minDates.append(sminmax[0])
-    if sminmax[1] is not None:
-        maxDates.append(sminmax[1])
-    
-    if len(minDates) > 0:
-        overallMinDate = min(minDates)
-    else:
-        overallMinDate = "----"
-    if len(maxDates) > 0:
-        overallMaxDate = max(maxDates)
+
+    # One pass over each violation table for count, date range and total:
+    sql = """
+    SELECT COUNT(*), MIN(Violation_Date), MAX(Violation_Date), SUM(Num_Violations)
+    FROM {table};
+    """
+    dbCursor.execute(sql.format(table="RedViolations"))
+    redRow = dbCursor.fetchone()
+    dbCursor.execute(sql.format(table="SpeedViolations"))
+    speedRow = dbCursor.fetchone()
+
+    # Min & max date across both tables, ignoring an empty table's None:
+    minDates = [d for d in [redRow[1], speedRow[1]] if d is not None]
+    maxDates = [d for d in [redRow[2], speedRow[2]] if d is not None]
+
+    return {
+        "Red_Cameras": redCamCount,
+        "Speed_Cameras": speedCamCount,
+        "Red_Entries": redRow[0],
+        "Speed_Entries": speedRow[0],
+        "Min_Date": min(minDates) if len(minDates) > 0 else None,
+        "Max_Date": max(maxDates) if len(maxDates) > 0 else None,
+        "Red_Total": redRow[3],
+        "Speed_Total": speedRow[3],
+    }
+
+
+##################################################################
+#
+# get_stats
+#
+# Returns the general statistics as a dict keyed by STATS_COLUMNS,
+# served from Stats_Snapshot when its data version is still current,
+# otherwise recomputed and saved. If the snapshot cannot be saved
+# (e.g. a read-only database) the fresh numbers are still returned.
+#
+def get_stats(dbConn):
+    dbCursor = dbConn.cursor()
+    dataVersion = stats_data_version(dbConn)
+    if dataVersion is None:
+        return _compute_stats(dbConn)
+    try:
+        dbCursor.execute(f"""
+        SELECT {", ".join(STATS_COLUMNS)}
+        FROM Stats_Snapshot
+        WHERE Data_Version = ?;
+        """, [dataVersion])
+        row = dbCursor.fetchone()
+    except sqlite3.Error:
+        # Stats_Snapshot has never been created
+        row = None
+    if row is not None:
+        return dict(zip(STATS_COLUMNS, row))
+
+    stats = _compute_stats(dbConn)
+    try:
+        dbCursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS Stats_Snapshot (
+            Data_Version TEXT NOT NULL,
+            {", ".join(STATS_COLUMNS)}
+        );
+        """)
+        dbCursor.execute("DELETE FROM Stats_Snapshot;")
+        dbCursor.execute(f"""
+        INSERT INTO Stats_Snapshot (Data_Version, {", ".join(STATS_COLUMNS)})
+        VALUES ({", ".join(["?"] * (len(STATS_COLUMNS) + 1))});
+        """, [dataVersion] + [stats[c] for c in STATS_COLUMNS])
+        dbConn.commit()
+    except sqlite3.Error:
+        dbConn.rollback()
+    return stats
+
+
+##################################################################
+#
+# clear_stats_snapshot
+#
+# Forgets the saved statistics so the next get_stats recomputes them.
+#
+def clear_stats_snapshot(dbConn):
+    try:
+        dbConn.execute("DELETE FROM Stats_Snapshot;")
+        dbConn.commit()
+    except sqlite3.Error:
+        dbConn.rollback()
+
+
+##################################################################
+#
+# print_stats
+#
+# Displays the initial stats, computing them only if the data has
+# changed since the last snapshot.
+def print_stats(dbConn):
+    stats = get_stats(dbConn)
+
+    overallMinDate = stats["Min_Date"] if stats["Min_Date"] is not None else "----"
+    overallMaxDate = stats["Max_Date"] if stats["Max_Date"] is not None else "----"
+
+    print("General Statistics:")
+    print("  Number of Red Light Cameras:", formatInt(stats["Red_Cameras"]))
+    print("  Number of Speed Cameras:", formatInt(stats["Speed_Cameras"]))
+    print("  Number of Red Light Camera Violation Entries:", formatInt(stats["Red_Entries"]))
+    print("  Number of Speed Camera Violation Entries:", formatInt(stats["Speed_Entries"]))
+    print("  Range of Dates in the Database:", f"{overallMinDate} - {overallMaxDate}")
+    print("  Total Number of Red Light Camera Violations:", formatInt(stats["Red_Total"]))
+    print("  Total Number of Speed Camera Violations:", formatInt(stats["Speed_Total"]))
+
+
+##################################################################
+#
+# Name and address search indexes
+#
+# Intersections_Search, RedCameras_Search and SpeedCameras_Search are
+# FTS5 trigram indexes over Intersections.Intersection and the camera
+# Address columns. They are external-content tables keyed by rowid and
+# kept in sync with their source tables by insert/update/delete
+# triggers, so cameras added later are searchable immediately.
+#
+# A trigram index can only narrow a LIKE pattern that contains at least
+# three consecutive literal characters. For those patterns the index
+# picks the candidate rows and the original LIKE is applied again on the
+# source table, so results are exactly what LIKE alone would return;
+# every other pattern (or a database without the indexes) runs plain LIKE.
+#
+# source table -> column indexed for searching
+SEARCH_COLUMNS = {
+    "Intersections": "Intersection",
+    "RedCameras": "Address",
+    "SpeedCameras": "Address",
+}
+
+
+##################################################################
+#
+# create_search_indexes
+#
+# Creates and populates any missing search index plus its sync
+# triggers. Returns False if they cannot be created (e.g. a read-only
+# database or an SQLite built without FTS5).
+#
+def create_search_indexes(dbConn):
+    # look again rather than trust a remembered answer:
+    connection_info(dbConn).pop("search_indexes", None)
+    try:
+        dbCursor = dbConn.cursor()
+        for table, column in SEARCH_COLUMNS.items():
+            if has_search_index(dbConn, table):
+                continue
+            dbCursor.execute(f"""
+            CREATE VIRTUAL TABLE {table}_Search
+            USING fts5({column}, content='{table}', content_rowid='rowid', tokenize='trigram');
+            """)
+            dbCursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_Search_Insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {table}_Search (rowid, {column}) VALUES (new.rowid, new.{column});
+            END;
+            """)
+            dbCursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_Search_Delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {table}_Search ({table}_Search, rowid, {column})
+                VALUES ('delete', old.rowid, old.{column});
+            END;
+            """)
+            dbCursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_Search_Update AFTER UPDATE ON {table} BEGIN
+                INSERT INTO {table}_Search ({table}_Search, rowid, {column})
+                VALUES ('delete', old.rowid, old.{column});
+                INSERT INTO {table}_Search (rowid, {column}) VALUES (new.rowid, new.{column});
+            END;
+            """)
+            dbCursor.execute(f"INSERT INTO {table}_Search ({table}_Search) VALUES ('rebuild');")
+        dbConn.commit()
+        return True
+    except sqlite3.Error as e:
+        dbConn.rollback()
+        print("Search indexes unavailable:", e)
+        return False
+    finally:
+        connection_info(dbConn).pop("search_indexes", None)
+
+
+# True if the table's search index exists, remembered per connection
+# (see connect) once it has been looked up outside a transaction.
+def has_search_index(dbConn, table):
+    known = connection_info(dbConn).setdefault("search_indexes", {})
+    found = known.get(table)
+    if found is None:
+        dbCursor = dbConn.cursor()
+        dbCursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;",
+                         [f"{table}_Search"])
+        found = dbCursor.fetchone() is not None
+        if not dbConn.in_transaction:
+            known[table] = found
+    return found
+
+
+def _has_trigram(pattern):
+    run = 0
+    for ch in pattern:
+        if ch == '%' or ch == '_':
+            run = 0
+        else:
+            run += 1
+            if run >= 3:
+                return True
+    return False
+
+
+##################################################################
+#
+# like_predicate
+#
+# Returns (sql, parameters) for a WHERE condition on the given source
+# table equivalent to "<column> LIKE pattern", using the table's search
+# index when it can narrow the pattern.
+#
+def like_predicate(dbConn, table, pattern):
+    column = SEARCH_COLUMNS[table]
+    if _has_trigram(pattern) and has_search_index(dbConn, table):
+        sql = (f"rowid IN (SELECT rowid FROM {table}_Search WHERE {column} LIKE ?) "
+               f"AND {column} LIKE ?")
+        return (sql, [pattern, pattern])
+    return (f"{column} LIKE ?", [pattern])
+
+
+##################################################################
+#
+# Concurrent red/speed queries
+#
+# Most commands run a red light query and an independent speed query.
+# run_red_speed runs the two halves at the same time on a small thread
+# pool. An sqlite3 connection cannot be shared between threads, so each
+# worker thread opens its own read-only connection to the database file
+# and keeps it for later queries. The halves run one after the other on
+# the caller's connection instead when parallel queries are turned off
+# (--serial), the database is in memory, or the caller has uncommitted
+# changes the workers could not see.
+#
+QUERY_SETTINGS = {"parallel": True, "workers": 2}
+
+_queryPool = None
+_workerConns = threading.local()
+
+
+def _database_file(dbConn):
+    # first row is always "main": (seq, name, file); file is "" in memory
+    return dbConn.execute("PRAGMA database_list;").fetchone()[2]
+
+
+def _run_on_worker(dbFile, query):
+    conns = getattr(_workerConns, "conns", None)
+    if conns is None:
+        conns = {}
+        _workerConns.conns = conns
+    conn = conns.get(dbFile)
+    if conn is None:
+        conn = connect(f"file:{urllib.parse.quote(dbFile)}?mode=ro", uri=True)
+        conns[dbFile] = conn
+    return query(conn)
+
+
+##################################################################
+#
+# run_red_speed
+#
+# Runs redQuery(conn) and speedQuery(conn), either of which may be None
+# to skip it, and returns (redResult, speedResult) -- None for a
+# skipped half.
+#
+def run_red_speed(dbConn, redQuery, speedQuery):
+    global _queryPool
+    if redQuery is None or speedQuery is None or not QUERY_SETTINGS["parallel"] \
+            or dbConn.in_transaction:
+        dbFile = ""
     else:
-        overallMaxDate = "----"
+        dbFile = _database_file(dbConn)
     
-    # 6) Total Number of Red Light Camera Violations:
-    dbCursor.execute("SELECT SUM(Num_Violations) FROM RedViolations;")
-    totalRedV = dbCursor.fetchone()[0]
+    if dbFile == "":
+        redResult = redQuery(dbConn) if redQuery is not None else None
+        speedResult = speedQuery(dbConn) if speedQuery is not None else None
+        return (redResult, speedResult)
     
-    # 7) Total Number of Speed Camera Violations:
-    dbCursor.execute("SELECT SUM(Num_Violations) FROM SpeedViolations;")
-    totalSpeedV = dbCursor.fetchone()[0]
-    
-    print("General Statistics:")
-    print("  Number of Red Light Cameras:", formatInt(redCamCount))
-    print("  Number of Speed Cameras:", formatInt(speedCamCount))
-    print("  Number of Red Light Camera Violation Entries:", formatInt(redViolationsCount))
-    print("  Number of Speed Camera Violation Entries:", formatInt(speedViolationsCount))
-    print("  Range of Dates in the Database:", f"{overallMinDate} - {overallMaxDate}")
-    print("  Total Number of Red Light Camera Violations:", formatInt(totalRedV))
-    print("  Total Number of Speed Camera Violations:", formatInt(totalSpeedV))
+    if _queryPool is None:
+        _queryPool = ThreadPoolExecutor(max_workers=QUERY_SETTINGS["workers"],
+                                        thread_name_prefix="query")
+    redFuture = _queryPool.submit(_run_on_worker, dbFile, redQuery)
+    speedFuture = _queryPool.submit(_run_on_worker, dbFile, speedQuery)
+    return (redFuture.result(), speedFuture.result())
 
 
 ##################################################################
@@ -96,19 +742,27 @@ def print_stats(dbConn):
 # Find an intersection by name (user may include _ or % wildcards).
 # Print them in alphabetical order by intersection name.
 #
-def command1_find_intersection(dbConn):
-    userInput = input("Enter the name of the intersection to find (wildcards _ and % allowed): ")
-    
+# find_intersections returns the matching (Intersection_ID, Intersection)
+# rows.
+#
+def find_intersections(dbConn, pattern):
     dbCursor = dbConn.cursor()
     # Use LIKE since wildcards are allowed:
-    sql = """
+    where, params = like_predicate(dbConn, "Intersections", pattern)
+    sql = f"""
     SELECT Intersection_ID, Intersection
     FROM Intersections
-    WHERE Intersection LIKE ?
+    WHERE {where}
     ORDER BY Intersection ASC;
     """
-    dbCursor.execute(sql, [userInput])
-    rows = dbCursor.fetchall()
+    dbCursor.execute(sql, params)
+    return dbCursor.fetchall()
+
+
+def command1_find_intersection(dbConn):
+    userInput = input("Enter the name of the intersection to find (wildcards _ and % allowed): ")
+    
+    rows = find_intersections(dbConn, userInput)
     
     if len(rows) == 0:
         print("No intersections matching that name were found.")
@@ -126,9 +780,10 @@ def command1_find_intersection(dbConn):
 # Given an intersection name (exact match), find and list all cameras.
 # If none found in red or speed, print messages accordingly.
 #
-def command2_find_all_cameras(dbConn):
-    print("Enter the name of the intersection (no wildcards allowed): ")
-    userInput = input()
+# find_cameras_at_intersection returns {"red": rows, "speed": rows} of
+# (Camera_ID, Address); both are empty if the intersection does not exist.
+#
+def find_cameras_at_intersection(dbConn, intersectionName):
     dbCursor = dbConn.cursor()
     
     # First, find the Intersection_ID from Intersections table with exact match:
@@ -137,37 +792,46 @@ def command2_find_all_cameras(dbConn):
     FROM Intersections
     WHERE Intersection = ?
     """
-    dbCursor.execute(sql, [userInput])
+    dbCursor.execute(sql, [intersectionName])
     row = dbCursor.fetchone()
     
     if row is None:
         # Intersection does not exist in DB at all -> no cameras of either type
-        print("No red light cameras found at that intersection.")
-        print()
-        print("No speed cameras found at that intersection.")
-        return
+        return {"red": [], "speed": []}
     
     intersectionID = row[0]
     
     # Query red cameras:
-    sql_red = """
-    SELECT Camera_ID, Address
-    FROM RedCameras
-    WHERE Intersection_ID = ?
-    ORDER BY Camera_ID ASC;
-    """
-    dbCursor.execute(sql_red, [intersectionID])
-    redRows = dbCursor.fetchall()
+    def red(conn):
+        sql_red = """
+        SELECT Camera_ID, Address
+        FROM RedCameras
+        WHERE Intersection_ID = ?
+        ORDER BY Camera_ID ASC;
+        """
+        return conn.execute(sql_red, [intersectionID]).fetchall()
     
     # Query speed cameras:
-    sql_speed = """
-    SELECT Camera_ID, Address
-    FROM SpeedCameras
-    WHERE Intersection_ID = ?
-    ORDER BY Camera_ID ASC;
-    """
-    dbCursor.execute(sql_speed, [intersectionID])
-    speedRows = dbCursor.fetchall()
+    def speed(conn):
+        sql_speed = """
+        SELECT Camera_ID, Address
+        FROM SpeedCameras
+        WHERE Intersection_ID = ?
+        ORDER BY Camera_ID ASC;
+        """
+        return conn.execute(sql_speed, [intersectionID]).fetchall()
+    
+    redRows, speedRows = run_red_speed(dbConn, red, speed)
+    return {"red": redRows, "speed": speedRows}
+
+
+def command2_find_all_cameras(dbConn):
+    print("Enter the name of the intersection (no wildcards allowed): ")
+    userInput = input()
+    
+    cameras = find_cameras_at_intersection(dbConn, userInput)
+    redRows = cameras["red"]
+    speedRows = cameras["speed"]
     
     # Print results:
     if len(redRows) == 0:
@@ -194,31 +858,45 @@ def command2_find_all_cameras(dbConn):
 # For a given date, output # of red light violations, # of speed violations,
 # plus percentages of each out of total. If total is 0 -> "No violations on record".
 #
-def command3_percentage_by_date(dbConn):
-    userInput = input("Enter the date that you would like to look at (format should be YYYY-MM-DD): ")
-    dbCursor = dbConn.cursor()
-    
+# violations_on_date returns {"red": count, "speed": count} for the date.
+#
+def violations_on_date(dbConn, violationDate):
     # Query total # red violations for that date:
-    sql_red = """
-    SELECT SUM(Num_Violations)
-    FROM RedViolations
-    WHERE Violation_Date = ?
-    """
-    dbCursor.execute(sql_red, [userInput])
-    redCount = dbCursor.fetchone()[0]
-    if redCount is None:
-        redCount = 0
+    def red(conn):
+        redTable = violation_source(conn, "RedViolations", "Daily")
+        sql_red = f"""
+        SELECT SUM(Num_Violations)
+        FROM {redTable}
+        WHERE Violation_Date = ?
+        """
+        redCount = conn.execute(sql_red, [violationDate]).fetchone()[0]
+        if redCount is None:
+            redCount = 0
+        return redCount
     
     # Query total # speed violations for that date:
-    sql_speed = """
-    SELECT SUM(Num_Violations)
-    FROM SpeedViolations
-    WHERE Violation_Date = ?
-    """
-    dbCursor.execute(sql_speed, [userInput])
-    speedCount = dbCursor.fetchone()[0]
-    if speedCount is None:
-        speedCount = 0
+    def speed(conn):
+        speedTable = violation_source(conn, "SpeedViolations", "Daily")
+        sql_speed = f"""
+        SELECT SUM(Num_Violations)
+        FROM {speedTable}
+        WHERE Violation_Date = ?
+        """
+        speedCount = conn.execute(sql_speed, [violationDate]).fetchone()[0]
+        if speedCount is None:
+            speedCount = 0
+        return speedCount
+    
+    redCount, speedCount = run_red_speed(dbConn, red, speed)
+    return {"red": redCount, "speed": speedCount}
+
+
+def command3_percentage_by_date(dbConn):
+    userInput = input("Enter the date that you would like to look at (format should be YYYY-MM-DD): ")
+    
+    counts = violations_on_date(dbConn, userInput)
+    redCount = counts["red"]
+    speedCount = counts["speed"]
     
     total = redCount + speedCount
     if total == 0:
@@ -240,25 +918,53 @@ def command3_percentage_by_date(dbConn):
 # Output the number of red light cameras at each intersection (descending),
 # plus % of total red cameras in the city; then speed cameras similarly.
 #
-def command4_cameras_per_intersection(dbConn):
-    dbCursor = dbConn.cursor()
-    
+# cameras_per_intersection returns the total number of red and speed
+# cameras ("red_total", "speed_total") and the per-intersection
+# (Intersection, Intersection_ID, count) rows ("red", "speed").
+#
+def cameras_per_intersection(dbConn):
     # Number of red cameras at each intersection:
     # plus total # of red cameras:
-    dbCursor.execute("SELECT COUNT(*) FROM RedCameras;")
-    totalRedCams = dbCursor.fetchone()[0]
+    def red(conn):
+        totalRedCams = conn.execute("SELECT COUNT(*) FROM RedCameras;").fetchone()[0]
+        
+        sql_red = """
+        SELECT Intersections.Intersection, Intersections.Intersection_ID,
+               COUNT(RedCameras.Camera_ID) as RedCount
+        FROM Intersections
+        JOIN RedCameras
+          ON Intersections.Intersection_ID = RedCameras.Intersection_ID
+        GROUP BY Intersections.Intersection_ID
+        ORDER BY RedCount DESC, Intersections.Intersection_ID DESC;
+        """
+        return (totalRedCams, conn.execute(sql_red).fetchall())
     
-    sql_red = """
-    SELECT Intersections.Intersection, Intersections.Intersection_ID,
-           COUNT(RedCameras.Camera_ID) as RedCount
-    FROM Intersections
-    JOIN RedCameras
-      ON Intersections.Intersection_ID = RedCameras.Intersection_ID
-    GROUP BY Intersections.Intersection_ID
-    ORDER BY RedCount DESC, Intersections.Intersection_ID DESC;
-    """
-    dbCursor.execute(sql_red)
-    redRows = dbCursor.fetchall()
+    # Speed cameras:
+    def speed(conn):
+        totalSpeedCams = conn.execute("SELECT COUNT(*) FROM SpeedCameras;").fetchone()[0]
+        
+        sql_speed = """
+        SELECT Intersections.Intersection, Intersections.Intersection_ID,
+               COUNT(SpeedCameras.Camera_ID) as SpeedCount
+        FROM Intersections
+        JOIN SpeedCameras
+          ON Intersections.Intersection_ID = SpeedCameras.Intersection_ID
+        GROUP BY Intersections.Intersection_ID
+        ORDER BY SpeedCount DESC, Intersections.Intersection_ID DESC;
+        """
+        return (totalSpeedCams, conn.execute(sql_speed).fetchall())
+    
+    (totalRedCams, redRows), (totalSpeedCams, speedRows) = run_red_speed(dbConn, red, speed)
+    return {"red_total": totalRedCams, "red": redRows,
+            "speed_total": totalSpeedCams, "speed": speedRows}
+
+
+def command4_cameras_per_intersection(dbConn):
+    counts = cameras_per_intersection(dbConn)
+    totalRedCams = counts["red_total"]
+    redRows = counts["red"]
+    totalSpeedCams = counts["speed_total"]
+    speedRows = counts["speed"]
     
     print("Number of Red Light Cameras at Each Intersection")
     if totalRedCams <= 0:
@@ -272,21 +978,6 @@ def command4_cameras_per_intersection(dbConn):
             pct = (count / totalRedCams) * 100
             print(f"  {name} ({iid}) : {count} ({pct:.3f}%)")
     print()
-    # Speed cameras:
-    dbCursor.execute("SELECT COUNT(*) FROM SpeedCameras;")
-    totalSpeedCams = dbCursor.fetchone()[0]
-    
-    sql_speed = """
-    SELECT Intersections.Intersection, Intersections.Intersection_ID,
-           COUNT(SpeedCameras.Camera_ID) as SpeedCount
-    FROM Intersections
-    JOIN SpeedCameras
-      ON Intersections.Intersection_ID = SpeedCameras.Intersection_ID
-    GROUP BY Intersections.Intersection_ID
-    ORDER BY SpeedCount DESC, Intersections.Intersection_ID DESC;
-    """
-    dbCursor.execute(sql_speed)
-    speedRows = dbCursor.fetchall()
     
     print("Number of Speed Cameras at Each Intersection")
     if totalSpeedCams <= 0:
@@ -308,37 +999,83 @@ def command4_cameras_per_intersection(dbConn):
 # ordered descending by count, plus the percentage out of the total for that year.
 # Then the same for speed. If none -> "No red light violations..." etc.
 #
+# violations_per_intersection returns the year's total red and speed
+# violations ("red_total", "speed_total") and the per-intersection
+# (Intersection, Intersection_ID, count) rows ("red", "speed").
+#
+def violations_per_intersection(dbConn, year):
+    startDate, endDate = year_date_range(year)
+    
+    # Red Light:
+    def red(conn):
+        redTable = violation_source(conn, "RedViolations", "Yearly")
+        sql_red = f"""
+        SELECT I.Intersection, I.Intersection_ID,
+               SUM(R.Num_Violations) as TotalRed
+        FROM {redTable} R
+        JOIN RedCameras RC
+          ON R.Camera_ID = RC.Camera_ID
+        JOIN Intersections I
+          ON RC.Intersection_ID = I.Intersection_ID
+        WHERE R.Violation_Date >= ? AND R.Violation_Date < ?
+        GROUP BY I.Intersection_ID
+        ORDER BY TotalRed DESC, I.Intersection_ID DESC;
+        """
+        redRows = conn.execute(sql_red, [startDate, endDate]).fetchall()
+        
+        # Sum of all red violations for that year:
+        sql_red_sum = f"""
+        SELECT SUM(R.Num_Violations)
+        FROM {redTable} R
+        WHERE R.Violation_Date >= ? AND R.Violation_Date < ?
+        """
+        totalRed = conn.execute(sql_red_sum, [startDate, endDate]).fetchone()[0]
+        if totalRed is None:
+            totalRed = 0
+        return (totalRed, redRows)
+    
+    # Speed:
+    def speed(conn):
+        speedTable = violation_source(conn, "SpeedViolations", "Yearly")
+        sql_speed = f"""
+        SELECT I.Intersection, I.Intersection_ID,
+               SUM(S.Num_Violations) as TotalSpeed
+        FROM {speedTable} S
+        JOIN SpeedCameras SC
+          ON S.Camera_ID = SC.Camera_ID
+        JOIN Intersections I
+          ON SC.Intersection_ID = I.Intersection_ID
+        WHERE S.Violation_Date >= ? AND S.Violation_Date < ?
+        GROUP BY I.Intersection_ID
+        ORDER BY TotalSpeed DESC, I.Intersection_ID DESC;
+        """
+        speedRows = conn.execute(sql_speed, [startDate, endDate]).fetchall()
+        
+        # Sum of all speed violations for that year:
+        sql_speed_sum = f"""
+        SELECT SUM(S.Num_Violations)
+        FROM {speedTable} S
+        WHERE S.Violation_Date >= ? AND S.Violation_Date < ?
+        """
+        totalSpeed = conn.execute(sql_speed_sum, [startDate, endDate]).fetchone()[0]
+        if totalSpeed is None:
+            totalSpeed = 0
+        return (totalSpeed, speedRows)
+    
+    (totalRed, redRows), (totalSpeed, speedRows) = run_red_speed(dbConn, red, speed)
+    return {"red_total": totalRed, "red": redRows,
+            "speed_total": totalSpeed, "speed": speedRows}
+
+
 def command5_violations_per_intersection(dbConn):
     userYear = input("Enter the year that you would like to analyze: ")
     print()
-    dbCursor = dbConn.cursor()
     
-    # Red Light:
-    sql_red = """
-    SELECT I.Intersection, I.Intersection_ID,
-           SUM(R.Num_Violations) as TotalRed
-    FROM RedViolations R
-    JOIN RedCameras RC
-      ON R.Camera_ID = RC.Camera_ID
-    JOIN Intersections I
-      ON RC.Intersection_ID = I.Intersection_ID
-    WHERE strftime('%Y', R.Violation_Date) = ?
-    GROUP BY I.Intersection_ID
-    ORDER BY TotalRed DESC, I.Intersection_ID DESC;
-    """
-    dbCursor.execute(sql_red, [userYear])
-    redRows = dbCursor.fetchall()
-    
-    # Sum of all red violations for that year:
-    sql_red_sum = """
-    SELECT SUM(R.Num_Violations)
-    FROM RedViolations R
-    WHERE strftime('%Y', R.Violation_Date) = ?
-    """
-    dbCursor.execute(sql_red_sum, [userYear])
-    totalRed = dbCursor.fetchone()[0]
-    if totalRed is None:
-        totalRed = 0
+    counts = violations_per_intersection(dbConn, userYear)
+    totalRed = counts["red_total"]
+    redRows = counts["red"]
+    totalSpeed = counts["speed_total"]
+    speedRows = counts["speed"]
     
     print(f"Number of Red Light Violations at Each Intersection for {userYear}")
     if len(redRows) == 0:
@@ -356,33 +1093,6 @@ def command5_violations_per_intersection(dbConn):
         print(f"Total Red Light Violations in {userYear} : {formatInt(totalRed)}")
         print()
     
-    # Speed:
-    sql_speed = """
-    SELECT I.Intersection, I.Intersection_ID,
-           SUM(S.Num_Violations) as TotalSpeed
-    FROM SpeedViolations S
-    JOIN SpeedCameras SC
-      ON S.Camera_ID = SC.Camera_ID
-    JOIN Intersections I
-      ON SC.Intersection_ID = I.Intersection_ID
-    WHERE strftime('%Y', S.Violation_Date) = ?
-    GROUP BY I.Intersection_ID
-    ORDER BY TotalSpeed DESC, I.Intersection_ID DESC;
-    """
-    dbCursor.execute(sql_speed, [userYear])
-    speedRows = dbCursor.fetchall()
-    
-    # Sum of all speed violations for that year:
-    sql_speed_sum = """
-    SELECT SUM(S.Num_Violations)
-    FROM SpeedViolations S
-    WHERE strftime('%Y', S.Violation_Date) = ?
-    """
-    dbCursor.execute(sql_speed_sum, [userYear])
-    totalSpeed = dbCursor.fetchone()[0]
-    if totalSpeed is None:
-        totalSpeed = 0
-    
     print(f"Number of Speed Violations at Each Intersection for {userYear}")
     if len(speedRows) == 0:
         print("No speed violations on record for that year.")
@@ -400,13 +1110,12 @@ def command5_violations_per_intersection(dbConn):
 
 ##################################################################
 #
-# Command 6
+# Helper function: camera_types
 #
-# Given a camera ID, output # of violations by year (ascending).
-# Then optionally plot. If ID not found -> error message.
+# Returns (isRed, isSpeed): whether the camera ID appears in
+# RedCameras and/or SpeedCameras.
 #
-def command6_violations_by_year(dbConn):
-    userCamID = input("Enter a camera ID: ")
+def camera_types(dbConn, cameraID):
     dbCursor = dbConn.cursor()
     
     # Check if camera ID is in RedCameras or SpeedCameras:
@@ -415,53 +1124,72 @@ def command6_violations_by_year(dbConn):
     UNION
     SELECT 'speed' as Type FROM SpeedCameras WHERE Camera_ID = ?;
     """
-    dbCursor.execute(sql_check, [userCamID, userCamID])
+    dbCursor.execute(sql_check, [cameraID, cameraID])
     typeRows = dbCursor.fetchall()
-    if len(typeRows) == 0:
-        print("No cameras matching that ID were found in the database.")
-        return
     
-    # We do one query for red, one for speed
     isRed = any(tr[0] == 'red' for tr in typeRows)
     isSpeed = any(tr[0] == 'speed' for tr in typeRows)
+    return (isRed, isSpeed)
+
+
+##################################################################
+#
+# Command 6
+#
+# Given a camera ID, output # of violations by year (ascending).
+# Then optionally plot. If ID not found -> error message.
+#
+# violations_by_year returns a dict of year ('YYYY') -> total violations
+# for the camera, or None if no camera has that ID.
+#
+def violations_by_year(dbConn, cameraID):
+    isRed, isSpeed = camera_types(dbConn, cameraID)
+    if not isRed and not isSpeed:
+        return None
     
+    # We do one query for red, one for speed
     # We can union the results if the camera appears in both tables.
     # Then we group by year
+    sql = """
+    SELECT strftime('%Y', Violation_Date) as YY,
+           SUM(Num_Violations)
+    FROM {table}
+    WHERE Camera_ID = ?
+    GROUP BY YY
+    ORDER BY YY ASC;
+    """
+    
+    def red(conn):
+        redTable = violation_source(conn, "RedViolations", "Yearly")
+        return conn.execute(sql.format(table=redTable), [cameraID]).fetchall()
+    
+    def speed(conn):
+        speedTable = violation_source(conn, "SpeedViolations", "Yearly")
+        return conn.execute(sql.format(table=speedTable), [cameraID]).fetchall()
+    
+    redRows, speedRows = run_red_speed(dbConn, red if isRed else None,
+                                       speed if isSpeed else None)
     
     # We'll gather year -> total violations from whichever table is relevant.
     yearlyData = {}
-    
-    if isRed:
-        sql_red = """
-        SELECT strftime('%Y', Violation_Date) as YY,
-               SUM(Num_Violations)
-        FROM RedViolations
-        WHERE Camera_ID = ?
-        GROUP BY YY
-        ORDER BY YY ASC;
-        """
-        dbCursor.execute(sql_red, [userCamID])
-        rows = dbCursor.fetchall()
+    for rows in [redRows, speedRows]:
+        if rows is None:
+            continue
         for r in rows:
             year = r[0]
             count = r[1]
             yearlyData[year] = yearlyData.get(year, 0) + count
     
-    if isSpeed:
-        sql_speed = """
-        SELECT strftime('%Y', Violation_Date) as YY,
-               SUM(Num_Violations)
-        FROM SpeedViolations
-        WHERE Camera_ID = ?
-        GROUP BY YY
-        ORDER BY YY ASC;
-        """
-        dbCursor.execute(sql_speed, [userCamID])
-        rows = dbCursor.fetchall()
-        for r in rows:
-            year = r[0]
-            count = r[1]
-            yearlyData[year] = yearlyData.get(year, 0) + count
+    return yearlyData
+
+
+def command6_violations_by_year(dbConn):
+    userCamID = input("Enter a camera ID: ")
+    
+    yearlyData = violations_by_year(dbConn, userCamID)
+    if yearlyData is None:
+        print("No cameras matching that ID were found in the database.")
+        return
     
     # Sort by year ascending (as strings)
 
@@ -481,28 +1209,36 @@ def command6_violations_by_year(dbConn):
     # Ask user if they want to plot:
     doPlot = input("Plot? (y/n) ")
     if doPlot.lower() == 'y':
-        if len(sortedYears) > 0:
-            # Determine the range of years to plot (from earliest to latest in data)
-            startYear = int(sortedYears[0])
-            endYear   = int(sortedYears[-1])
+        plot_violations_by_year(dbConn, userCamID, yearlyData)
 
-            x_vals = []
-            y_vals = []
-            # Fill in 0 for any missing years in that continuous range
-            for year in range(startYear, endYear+1):
-                strYear = str(year)
-                count   = yearlyData.get(strYear, 0)  # default to 0 if missing
-                x_vals.append(year)
-                y_vals.append(count)
 
-            plt.figure(figsize=(8, 5))
-            # line plot
-            plt.plot(x_vals, y_vals, color='blue', marker='o')
-            plt.xlabel("Year")
-            plt.ylabel("Number of Violations")
-            plt.title(f"Yearly Violations for Camera {userCamID}")
-            plt.xticks(x_vals)
-            plt.show()
+def plot_violations_by_year(dbConn, cameraID, yearlyData):
+    sortedYears = sorted(yearlyData.keys())
+    if len(sortedYears) == 0:
+        return None
+    
+    # Determine the range of years to plot (from earliest to latest in data)
+    startYear = int(sortedYears[0])
+    endYear   = int(sortedYears[-1])
+
+    x_vals = []
+    y_vals = []
+    # Fill in 0 for any missing years in that continuous range
+    for year in range(startYear, endYear+1):
+        strYear = str(year)
+        count   = yearlyData.get(strYear, 0)  # default to 0 if missing
+        x_vals.append(year)
+        y_vals.append(count)
+
+    plt = get_pyplot()
+    plt.figure(figsize=(8, 5))
+    # line plot
+    plt.plot(x_vals, y_vals, color='blue', marker='o')
+    plt.xlabel("Year")
+    plt.ylabel("Number of Violations")
+    plt.title(f"Yearly Violations for Camera {cameraID}")
+    plt.xticks(x_vals)
+    return show_plot(plt, f"violations_by_year_{cameraID}")
 
 
 ##################################################################
@@ -512,64 +1248,61 @@ def command6_violations_by_year(dbConn):
 # Given a camera ID and a year, output # of violations for each month in ascending order by month.
 # Then optionally plot. If ID not found -> error message.
 #
-def command7_violations_by_month(dbConn):
-    userCamID = input("Enter a camera ID: ")
-    dbCursor = dbConn.cursor()
+# violations_by_month returns a dict of month ('MM') -> total violations
+# for the camera in that year, or None if no camera has that ID.
+#
+def violations_by_month(dbConn, cameraID, year):
+    isRed, isSpeed = camera_types(dbConn, cameraID)
+    if not isRed and not isSpeed:
+        return None
+    startDate, endDate = year_date_range(year)
     
-    # Check if camera ID is in RedCameras or SpeedCameras:
-    sql_check = """
-    SELECT 'red' as Type FROM RedCameras WHERE Camera_ID = ?
-    UNION
-    SELECT 'speed' as Type FROM SpeedCameras WHERE Camera_ID = ?;
+    sql = """
+    SELECT strftime('%m', Violation_Date) as MM,
+           SUM(Num_Violations)
+    FROM {table}
+    WHERE Camera_ID = ?
+      AND Violation_Date >= ? AND Violation_Date < ?
+    GROUP BY MM
+    ORDER BY MM ASC;
     """
-    dbCursor.execute(sql_check, [userCamID, userCamID])
-    typeRows = dbCursor.fetchall()
-    if len(typeRows) == 0:
-        print("No cameras matching that ID were found in the database.")
-        return
     
-    userYear = input("Enter a year: ")
+    def red(conn):
+        redTable = violation_source(conn, "RedViolations", "Monthly")
+        return conn.execute(sql.format(table=redTable), [cameraID, startDate, endDate]).fetchall()
     
-    isRed = any(tr[0] == 'red' for tr in typeRows)
-    isSpeed = any(tr[0] == 'speed' for tr in typeRows)
+    def speed(conn):
+        speedTable = violation_source(conn, "SpeedViolations", "Monthly")
+        return conn.execute(sql.format(table=speedTable), [cameraID, startDate, endDate]).fetchall()
+    
+    redRows, speedRows = run_red_speed(dbConn, red if isRed else None,
+                                       speed if isSpeed else None)
     
     # We'll gather month -> total violations. We’ll store in monthlyData["MM"] = sum
     monthlyData = {}
-    
-    if isRed:
-        sql_red = """
-        SELECT strftime('%m', Violation_Date) as MM,
-               SUM(Num_Violations)
-        FROM RedViolations
-        WHERE Camera_ID = ?
-          AND strftime('%Y', Violation_Date) = ?
-        GROUP BY MM
-        ORDER BY MM ASC;
-        """
-        dbCursor.execute(sql_red, [userCamID, userYear])
-        rows = dbCursor.fetchall()
-        for r in rows:
-            mm = r[0] 
-            count = r[1]
-            monthlyData[mm] = monthlyData.get(mm, 0) + count
-    
-    if isSpeed:
-        sql_speed = """
-        SELECT strftime('%m', Violation_Date) as MM,
-               SUM(Num_Violations)
-        FROM SpeedViolations
-        WHERE Camera_ID = ?
-          AND strftime('%Y', Violation_Date) = ?
-        GROUP BY MM
-        ORDER BY MM ASC;
-        """
-        dbCursor.execute(sql_speed, [userCamID, userYear])
-        rows = dbCursor.fetchall()
+    for rows in [redRows, speedRows]:
+        if rows is None:
+            continue
         for r in rows:
             mm = r[0]
             count = r[1]
             monthlyData[mm] = monthlyData.get(mm, 0) + count
     
+    return monthlyData
+
+
+def command7_violations_by_month(dbConn):
+    userCamID = input("Enter a camera ID: ")
+    
+    isRed, isSpeed = camera_types(dbConn, userCamID)
+    if not isRed and not isSpeed:
+        print("No cameras matching that ID were found in the database.")
+        return
+    
+    userYear = input("Enter a year: ")
+    
+    monthlyData = violations_by_month(dbConn, userCamID, userYear)
+    
     print(f"Monthly Violations for Camera {userCamID} in {userYear}")
     # We want to list months 1-12 in ascending order. If no data = no lines.
     for monthNum in range(1, 13):
@@ -580,22 +1313,85 @@ def command7_violations_by_month(dbConn):
     # Optionally plot:
     doPlot = input("Plot? (y/n) ")
     if doPlot.lower() == 'y':
-        # Build data for months 1-12:
-        x_vals = []
-        y_vals = []
-        for mm in sorted(monthlyData.keys()):
-            x_vals.append(int(mm))
-            y_vals.append(monthlyData[mm])
-        
-        plt.figure(figsize=(8, 5))
-        plt.plot(x_vals, y_vals, color='blue')
-        month_labels = [f"{m:02d}" for m in x_vals]
-        plt.xticks(x_vals, month_labels)
-        plt.xlabel("Month")
-        plt.ylabel("Number of Violations")
-        plt.title(f"Monthly Violations for Camera {userCamID} ({userYear})")
-        plt.xticks(x_vals)
-        plt.show()
+        plot_violations_by_month(dbConn, userCamID, userYear, monthlyData)
+
+
+def plot_violations_by_month(dbConn, cameraID, year, monthlyData):
+    # Build data for months 1-12:
+    x_vals = []
+    y_vals = []
+    for mm in sorted(monthlyData.keys()):
+        x_vals.append(int(mm))
+        y_vals.append(monthlyData[mm])
+    
+    plt = get_pyplot()
+    plt.figure(figsize=(8, 5))
+    plt.plot(x_vals, y_vals, color='blue')
+    month_labels = [f"{m:02d}" for m in x_vals]
+    plt.xticks(x_vals, month_labels)
+    plt.xlabel("Month")
+    plt.ylabel("Number of Violations")
+    plt.title(f"Monthly Violations for Camera {cameraID} ({year})")
+    plt.xticks(x_vals)
+    return show_plot(plt, f"violations_by_month_{cameraID}_{year}")
+
+
+##################################################################
+#
+# daily_series
+#
+# Builds the red and speed violations for every day from Jan 1 of
+# startYear through Dec 31 of endYear as dense NumPy arrays, with 0 for
+# days that have no violations. Returns (days, red, speed) where days
+# numbers the days 1, 2, ... and red[i] / speed[i] belong to days[i].
+#
+# Runs the same two per-date queries as command 8 over the whole range
+# and hands them to daily_arrays, so multi-year ranges cost no more
+# than the queries themselves.
+#
+def daily_series(dbConn, startYear, endYear):
+    dailyData = _violations_by_day(dbConn, f"{startYear:04d}-01-01", f"{endYear + 1:04d}-01-01")
+    return daily_arrays(startYear, endYear, dailyData)
+
+
+##################################################################
+#
+# daily_arrays
+#
+# Turns a violations_by_day dict (date -> [red, speed]) into the
+# (days, red, speed) arrays described under daily_series, for Jan 1 of
+# startYear through Dec 31 of endYear. The totals are scattered into
+# zero-filled arrays in one step. Dates that are not real calendar
+# days in the range (e.g. a malformed "2016-13-45" row) are left out.
+# NumPy is only imported on first use.
+#
+def daily_arrays(startYear, endYear, dailyData):
+    import numpy as np
+    
+    startDate = np.datetime64(f"{startYear:04d}-01-01")
+    numDays = int((np.datetime64(f"{endYear + 1:04d}-01-01") - startDate) / np.timedelta64(1, 'D'))
+    days = np.arange(1, numDays + 1)
+    red = np.zeros(numDays, dtype=np.int64)
+    speed = np.zeros(numDays, dtype=np.int64)
+    
+    dates = [d for d in dailyData if _is_calendar_date(d)]
+    if len(dates) > 0:
+        offsets = (np.array(dates, dtype='datetime64[D]') - startDate).astype(np.int64)
+        counts = np.array([[c or 0 for c in dailyData[d]] for d in dates], dtype=np.int64)
+        inRange = (offsets >= 0) & (offsets < numDays)
+        red[offsets[inRange]] = counts[inRange, 0]
+        speed[offsets[inRange]] = counts[inRange, 1]
+    return (days, red, speed)
+
+
+def _is_calendar_date(text):
+    if not isinstance(text, str) or len(text) != 10:
+        return False
+    try:
+        datetime.datetime.strptime(text, "%Y-%m-%d")
+    except ValueError:
+        return False
+    return True
 
 
 ##################################################################
@@ -607,48 +1403,60 @@ def command7_violations_by_month(dbConn):
 # Only print first 5 lines and last 5 lines for each. Optionally plot the entire year (Jan 1 - Dec 31),
 # with 0 for days not in the DB.
 #
-def command8_compare_by_day(dbConn):
-    userYear = input("Enter a year: ")
-    dbCursor = dbConn.cursor()
-    
-    # We’ll gather a dict: dateStr -> (#red, #speed)
-    # dateStr in 'YYYY-MM-DD' format
-    dailyData = {}
-    
-    # Red query:
-    sql_red = """
+# violations_by_day returns a dict of date ('YYYY-MM-DD') -> [red, speed]
+# violations for every day of the year that has any.
+#
+def violations_by_day(dbConn, year):
+    startDate, endDate = year_date_range(year)
+    return _violations_by_day(dbConn, startDate, endDate)
+
+
+# violations_by_day for the dates startDate <= date < endDate.
+def _violations_by_day(dbConn, startDate, endDate):
+    sql = """
     SELECT Violation_Date, SUM(Num_Violations)
-    FROM RedViolations
-    WHERE strftime('%Y', Violation_Date) = ?
+    FROM {table}
+    WHERE Violation_Date >= ? AND Violation_Date < ?
     GROUP BY Violation_Date
     ORDER BY Violation_Date;
     """
-    dbCursor.execute(sql_red, [userYear])
-    rows = dbCursor.fetchall()
-    for r in rows:
+    
+    # Red query:
+    def red(conn):
+        redTable = violation_source(conn, "RedViolations", "Daily")
+        return conn.execute(sql.format(table=redTable), [startDate, endDate]).fetchall()
+    
+    # Speed query:
+    def speed(conn):
+        speedTable = violation_source(conn, "SpeedViolations", "Daily")
+        return conn.execute(sql.format(table=speedTable), [startDate, endDate]).fetchall()
+    
+    redRows, speedRows = run_red_speed(dbConn, red, speed)
+    
+    # We’ll gather a dict: dateStr -> (#red, #speed)
+    # dateStr in 'YYYY-MM-DD' format
+    dailyData = {}
+    for r in redRows:
         d = r[0]
         cnt = r[1]
         if d not in dailyData:
             dailyData[d] = [0, 0]
         dailyData[d][0] = cnt
-    
-    # Speed query:
-    sql_speed = """
-    SELECT Violation_Date, SUM(Num_Violations)
-    FROM SpeedViolations
-    WHERE strftime('%Y', Violation_Date) = ?
-    GROUP BY Violation_Date
-    ORDER BY Violation_Date;
-    """
-    dbCursor.execute(sql_speed, [userYear])
-    rows = dbCursor.fetchall()
-    for r in rows:
+    for r in speedRows:
         d = r[0]
         cnt = r[1]
         if d not in dailyData:
             dailyData[d] = [0, 0]
         dailyData[d][1] = cnt
     
+    return dailyData
+
+
+def command8_compare_by_day(dbConn):
+    userYear = input("Enter a year: ")
+    
+    dailyData = violations_by_day(dbConn, userYear)
+    
     # Sort the dictionary by date:
     # The keys are 'YYYY-MM-DD' so we can sort them or use datetime.
     sortedDates = sorted(dailyData.keys())
@@ -685,53 +1493,29 @@ def command8_compare_by_day(dbConn):
     # Option to plot:
     doPlot = input("Plot? (y/n) ")
     if doPlot.lower() == 'y':
-        # For each day from Jan 1 to Dec 31 of userYear, we might have data or zero.
-        # Make x array of datetime.date objects, plus y arrays for red & speed.
-        try:
-            yInt = int(userYear)
-        except:
-            # invalid int means no plot
-            return
-        
-        # Start date, end date:
-        startD = datetime.date(yInt, 1, 1)
-        endD = datetime.date(yInt, 12, 31)
-        delta = datetime.timedelta(days=1)
-        
-        dayList = []
-
-        redList = []
-        speedList = []
-
-        # We'll keep an integer i that increments for each day.
-        i = 0
-        currD = startD
-        while currD <= endD:
-            i += 1  # Day counter in the year
-            dStr = currD.isoformat()
-            
-            if dStr in dailyData:
-                rVal = dailyData[dStr][0]
-                sVal = dailyData[dStr][1]
-            else:
-                rVal = 0
-                sVal = 0
-            
-            dayList.append(i)
-            redList.append(rVal)
-            speedList.append(sVal)
-            
-            currD += delta
-
-        #plots
-        plt.figure(figsize=(8, 5))
-        plt.plot(dayList, redList, color='red', label='Red Light')
-        plt.plot(dayList, speedList, color='orange', label='Speed')
-        plt.title(f"Violations Each Day of {userYear}")
-        plt.xlabel("Day")
-        plt.ylabel("Number of Violations")
-        plt.legend()
-        plt.show()
+        plot_violations_by_day(dbConn, userYear, dailyData)
+
+
+def plot_violations_by_day(dbConn, year, dailyData):
+    # For each day from Jan 1 to Dec 31 of the year, we might have data or zero.
+    try:
+        yInt = int(year)
+    except:
+        # invalid int means no plot
+        return None
+    
+    dayList, redList, speedList = daily_arrays(yInt, yInt, dailyData)
+
+    #plots
+    plt = get_pyplot()
+    plt.figure(figsize=(8, 5))
+    plt.plot(dayList, redList, color='red', label='Red Light')
+    plt.plot(dayList, speedList, color='orange', label='Speed')
+    plt.title(f"Violations Each Day of {year}")
+    plt.xlabel("Day")
+    plt.ylabel("Number of Violations")
+    plt.legend()
+    return show_plot(plt, f"violations_by_day_{year}")
 
 
 ##################################################################
@@ -741,33 +1525,36 @@ def command8_compare_by_day(dbConn):
 # Given a street name, find all cameras whose address is on that street.
 # Then optionally plot them on the map of Chicago (chicago.png).
 #
-def command9_cameras_on_street(dbConn):
-    userStreet = input("Enter a street name: ")
+# cameras_on_street returns {"red": rows, "speed": rows} of
+# (Camera_ID, Address, Latitude, Longitude).
+#
+def cameras_on_street(dbConn, street):
     # "Address LIKE '%street%'" for both RedCameras, SpeedCameras.
     # Then combine results. 
     # differentiate red vs speed so that we can color them differently on the plot.
     
-    dbCursor = dbConn.cursor()
+    def query(table):
+        def run(conn):
+            where, params = like_predicate(conn, table, f"%{street}%")
+            sql = f"""
+            SELECT Camera_ID, Address, Latitude, Longitude
+            FROM {table}
+            WHERE {where}
+            ORDER BY Camera_ID ASC
+            """
+            return conn.execute(sql, params).fetchall()
+        return run
     
-    # Red cameras:
-    sql_red = """
-    SELECT Camera_ID, Address, Latitude, Longitude
-    FROM RedCameras
-    WHERE Address LIKE ?
-    ORDER BY Camera_ID ASC
-    """
-    dbCursor.execute(sql_red, [f"%{userStreet}%"])
-    redRows = dbCursor.fetchall()
+    redRows, speedRows = run_red_speed(dbConn, query("RedCameras"), query("SpeedCameras"))
+    return {"red": redRows, "speed": speedRows}
+
+
+def command9_cameras_on_street(dbConn):
+    userStreet = input("Enter a street name: ")
     
-    # Speed cameras:
-    sql_speed = """
-    SELECT Camera_ID, Address, Latitude, Longitude
-    FROM SpeedCameras
-    WHERE Address LIKE ?
-    ORDER BY Camera_ID ASC
-    """
-    dbCursor.execute(sql_speed, [f"%{userStreet}%"])
-    speedRows = dbCursor.fetchall()
+    cameras = cameras_on_street(dbConn, userStreet)
+    redRows = cameras["red"]
+    speedRows = cameras["speed"]
     
     totalFound = len(redRows) + len(speedRows)
     if totalFound == 0:
@@ -806,52 +1593,209 @@ def command9_cameras_on_street(dbConn):
     doPlot = input("Plot? (y/n) ")
 
     if doPlot.lower() == 'y':
+        plot_cameras_on_street(dbConn, userStreet, cameras)
+
+
+def plot_cameras_on_street(dbConn, street, cameras):
+    if len(cameras["red"]) + len(cameras["speed"]) == 0:
+        return None
+    plt = get_pyplot()
+    try:
+        cityMap = plt.imread("chicago.png")
+    except:
+        print("Error: cannot find 'chicago.png' file for plotting the map.")
+        return None
+    
+    plt.figure(figsize=(8, 8))
+    xydims = [-87.9277, -87.5569, 41.7012, 42.0868]
+    plt.imshow(cityMap, extent=xydims)
+    plt.title(f"Cameras on Street: {street}")
+
+    # SORT the rows if you want them connected in a geographic order (e.g. by longitude):
+    redRows = sorted(cameras["red"], key=lambda row: row[3])      # sort by longitude, row[3]
+    speedRows = sorted(cameras["speed"], key=lambda row: row[3])  # for speed
+    
+    # Build x_red, y_red:
+    x_red = [row[3] for row in redRows]   # row[3] is longitude
+    y_red = [row[2] for row in redRows]   # row[2] is latitude
+    
+    # Build x_speed, y_speed:
+    x_speed = [row[3] for row in speedRows]
+    y_speed = [row[2] for row in speedRows]
+    
+    # Plot lines first, so they connect points in sorted order
+    plt.plot(x_red, y_red, color='red')       # no label -> won't appear in legend
+    plt.plot(x_speed, y_speed, color='orange')
+    
+    # Now scatter the points themselves:
+    plt.scatter(x_red, y_red, color='red')
+    plt.scatter(x_speed, y_speed, color='orange')
+    
+    # Annotate each camera ID:
+    for row in redRows:
+        cid = row[0]
+        lat = row[2]
+        lng = row[3]
+        plt.annotate(str(cid), (lng, lat), color='black', fontsize=8)
+    for row in speedRows:
+        cid = row[0]
+        lat = row[2]
+        lng = row[3]
+        plt.annotate(str(cid), (lng, lat), color='black', fontsize=8)
+    
+    plt.xlim([-87.9277, -87.5569])
+    plt.ylim([41.7012, 42.0868])
+    return show_plot(plt, f"cameras_on_street_{street}")
+
+
+##################################################################
+#
+# prepare_database
+#
+# Indexes the violation tables and the name/address columns, and
+# brings the rollups up to date with any new violation rows.
+#
+def prepare_database(dbConn):
+    create_violation_indexes(dbConn)
+    create_search_indexes(dbConn)
+    refresh_rollups(dbConn)
+
+
+##################################################################
+#
+# Batch mode
+#
+# Runs a list of jobs with no prompts, all on one shared connection,
+# and writes each job's result and run time as JSON or CSV. A job is a
+# command -- "stats" or a menu number "1" to "9" -- plus the answers to
+# that command's prompts, in prompt order (the "Plot?" question is not
+# asked). On the command line that is --job 7 1001 2018; in a job file
+# (a JSON list) it is ["7", "1001", "2018"] or
+# {"command": "7", "params": ["1001", "2018"]}, where params may also
+# be a dict of the query function's argument names.
+#
+# With --plot-dir, jobs for commands 6 - 9 also render their plot to a
+# file there, and the job's entry records the file as "plot".
+#
+BATCH_COMMANDS = {
+    "stats": get_stats,
+    "1": find_intersections,
+    "2": find_cameras_at_intersection,
+    "3": violations_on_date,
+    "4": cameras_per_intersection,
+    "5": violations_per_intersection,
+    "6": violations_by_year,
+    "7": violations_by_month,
+    "8": violations_by_day,
+    "9": cameras_on_street,
+}
+
+# command -> plot function, called as plot(dbConn, <job params>, result)
+BATCH_PLOTS = {
+    "6": plot_violations_by_year,
+    "7": plot_violations_by_month,
+    "8": plot_violations_by_day,
+    "9": plot_cameras_on_street,
+}
+
+
+def _parse_job(job):
+    if isinstance(job, dict):
+        command = str(job["command"])
+        params = job.get("params", [])
+    else:
+        command = str(job[0])
+        params = list(job[1:])
+    if command not in BATCH_COMMANDS:
+        raise ValueError(f"unknown command {command!r}")
+    return (command, params)
+
+
+##################################################################
+#
+# run_batch
+#
+# Runs the jobs in order and returns one result dict per job with the
+# command, params, elapsed seconds and either "result" or "error". A
+# job that fails is recorded with its error and the batch goes on; if
+# only its plot fails, the job keeps its "result" and the plot failure
+# is its "error". Raises ValueError for a job naming an unknown command.
+#
+def run_batch(dbConn, jobs):
+    results = []
+    for job in jobs:
+        command, params = _parse_job(job)
+        func = BATCH_COMMANDS[command]
+        entry = {}
+        start = time.perf_counter()
+        elapsed = None
         try:
-            cityMap = plt.imread("chicago.png")
-        except:
-            print("Error: cannot find 'chicago.png' file for plotting the map.")
-            return
-        
-        plt.figure(figsize=(8, 8))
-        xydims = [-87.9277, -87.5569, 41.7012, 42.0868]
-        plt.imshow(cityMap, extent=xydims)
-        plt.title(f"Cameras on Street: {userStreet}")
-
-        # SORT the rows if you want them connected in a geographic order (e.g. by longitude):
-        redRows.sort(key=lambda row: row[3])    # sort by longitude, row[3]
-        speedRows.sort(key=lambda row: row[3])  # for speed
-        
-        # Build x_red, y_red:
-        x_red = [row[3] for row in redRows]   # row[3] is longitude
-        y_red = [row[2] for row in redRows]   # row[2] is latitude
-        
-        # Build x_speed, y_speed:
-        x_speed = [row[3] for row in speedRows]
-        y_speed = [row[2] for row in speedRows]
-        
-        # Plot lines first, so they connect points in sorted order
-        plt.plot(x_red, y_red, color='red')       # no label -> won't appear in legend
-        plt.plot(x_speed, y_speed, color='orange')
-        
-        # Now scatter the points themselves:
-        plt.scatter(x_red, y_red, color='red')
-        plt.scatter(x_speed, y_speed, color='orange')
-        
-        # Annotate each camera ID:
-        for row in redRows:
-            cid = row[0]
-            lat = row[2]
-            lng = row[3]
-            plt.annotate(str(cid), (lng, lat), color='black', fontsize=8)
-        for row in speedRows:
-            cid = row[0]
-            lat = row[2]
-            lng = row[3]
-            plt.annotate(str(cid), (lng, lat), color='black', fontsize=8)
-        
-        plt.xlim([-87.9277, -87.5569])
-        plt.ylim([41.7012, 42.0868])
-        plt.show()
+            if isinstance(params, dict):
+                result = func(dbConn, **params)
+            else:
+                result = func(dbConn, *params)
+            elapsed = time.perf_counter() - start
+            entry["result"] = result
+            if PLOT_SETTINGS["dir"] is not None and command in BATCH_PLOTS \
+                    and result is not None:
+                if isinstance(params, dict):
+                    bound = inspect.signature(func).bind(dbConn, **params)
+                else:
+                    bound = inspect.signature(func).bind(dbConn, *params)
+                # keep plot messages out of the results:
+                with contextlib.redirect_stdout(sys.stderr):
+                    plotFile = BATCH_PLOTS[command](*bound.arguments.values(), result)
+                entry["plot"] = plotFile
+        except Exception as e:
+            if elapsed is None:
+                elapsed = time.perf_counter() - start
+                entry["error"] = str(e)
+            else:
+                entry["error"] = f"plot failed: {e}"
+        results.append({"command": command, "params": params, "seconds": elapsed, **entry})
+    return results
+
+
+def write_batch_results(results, outFile, outFormat):
+    if outFormat == "json":
+        json.dump(results, outFile, indent=2)
+        outFile.write("\n")
+    else:
+        # one line per job; params and result are JSON-encoded
+        writer = csv.writer(outFile)
+        writer.writerow(["command", "params", "seconds", "result", "error", "plot"])
+        for r in results:
+            result = json.dumps(r["result"]) if "result" in r else ""
+            writer.writerow([r["command"], json.dumps(r["params"]), f"{r['seconds']:.6f}",
+                             result, r.get("error", ""), r.get("plot") or ""])
+
+
+def batch_main(args):
+    jobs = []
+    if args.batch is not None:
+        with open(args.batch) as jobFile:
+            jobs.extend(json.load(jobFile))
+    if args.job is not None:
+        jobs.extend(args.job)
+    # reject malformed jobs before running any of them:
+    for job in jobs:
+        try:
+            _parse_job(job)
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            sys.exit(f"Invalid batch job {job!r}: {e}")
+
+    dbConn = connect(args.db)
+    # keep any provisioning messages out of the results:
+    with contextlib.redirect_stdout(sys.stderr):
+        prepare_database(dbConn)
+    results = run_batch(dbConn, jobs)
+    dbConn.close()
+
+    if args.output is None:
+        write_batch_results(results, sys.stdout, args.format)
+    else:
+        with open(args.output, "w", newline="") as outFile:
+            write_batch_results(results, outFile, args.format)
 
 
 ##################################################################
@@ -859,7 +1803,38 @@ def command9_cameras_on_street(dbConn):
 # main
 #
 def main():
-    dbConn = sqlite3.connect('chicago-traffic-cameras.db')
+    parser = argparse.ArgumentParser(description="Chicago Traffic Camera Analysis")
+    parser.add_argument("--db", default="chicago-traffic-cameras.db",
+                        help="database file (default: chicago-traffic-cameras.db)")
+    parser.add_argument("--batch", metavar="JOBFILE",
+                        help="run the jobs in this JSON file instead of the menu")
+    parser.add_argument("--job", nargs="+", action="append", metavar="ARG",
+                        help="run one job: a command (stats, 1-9) and its answers; repeatable")
+    parser.add_argument("--format", choices=["json", "csv"], default="json",
+                        help="batch output format (default: json)")
+    parser.add_argument("--output", metavar="FILE",
+                        help="write batch results to FILE instead of stdout")
+    parser.add_argument("--plot-dir", metavar="DIR",
+                        help="save plots as files in DIR instead of showing them (no display needed)")
+    parser.add_argument("--plot-format", choices=["png", "svg"], default="png",
+                        help="file format for --plot-dir (default: png)")
+    parser.add_argument("--serial", action="store_true",
+                        help="run red light and speed queries one after the other")
+    args = parser.parse_args()
+
+    if args.serial:
+        QUERY_SETTINGS["parallel"] = False
+
+    if args.plot_dir is not None:
+        os.makedirs(args.plot_dir, exist_ok=True)
+        PLOT_SETTINGS["dir"] = args.plot_dir
+        PLOT_SETTINGS["format"] = args.plot_format
+
+    if args.batch is not None or args.job is not None:
+        batch_main(args)
+        return
+
+    dbConn = connect(args.db)
     
     print("Project 1: Chicago Traffic Camera Analysis")
     print("CS 341, Spring 2025")
@@ -868,6 +1843,8 @@ def main():
     print("aspects of the Chicago traffic camera database.")
     print()
     
+    prepare_database(dbConn)
+
     # Print initial statistics:
     print_stats(dbConn)
     print()
@@ -0,0 +1,161 @@
+# Zarak Khan
+# Times print_stats and each commandN_* function of
+# ChicagoTrafficAnalysis.py against a database, feeding each command
+# scripted answers in place of input() and discarding what it prints.
+# Reports p50 / p95 latency and peak Python memory per command.
+#
+# Usage:
+#   python ChicagoTrafficGenerator.py synthetic.db
+#   python ChicagoTrafficBenchmark.py --db synthetic.db --repeat 20 --json bench.json
+
+
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import time
+import tracemalloc
+
+import ChicagoTrafficAnalysis
+
+
+##################################################################
+#
+# Helper function: percentile
+#
+# Nearest-rank percentile (0-100) of an ascending list of numbers.
+#
+def percentile(sortedValues, pct):
+    rank = max(1, -(-len(sortedValues) * pct // 100))  # ceil
+    return sortedValues[int(rank) - 1]
+
+
+##################################################################
+#
+# default_cases
+#
+# Picks representative answers from the database itself -- the first
+# intersection and street, a red light camera, and the latest year and
+# date on record -- and returns the benchmark cases as a list of
+# (name, function, answers, setup) tuples. setup (or None) runs before
+# each timed call and is not timed. Plot questions are answered "n".
+#
+def default_cases(dbConn):
+    dbCursor = dbConn.cursor()
+    dbCursor.execute("SELECT Intersection FROM Intersections ORDER BY Intersection_ID LIMIT 1;")
+    intersection = dbCursor.fetchone()[0]
+    dbCursor.execute("SELECT Camera_ID, Address FROM RedCameras ORDER BY Camera_ID LIMIT 1;")
+    cameraID, address = dbCursor.fetchone()
+    # "1234 N WESTERN AVE" -> "WESTERN"
+    street = address.split()[2] if len(address.split()) > 2 else address
+    dbCursor.execute("SELECT MAX(Violation_Date) FROM RedViolations;")
+    lastDate = dbCursor.fetchone()[0][:10]
+    year = lastDate[:4]
+
+    C = ChicagoTrafficAnalysis
+    return [
+        ("print_stats", C.print_stats, [], None),
+        ("print_stats (recompute)", C.print_stats, [], C.clear_stats_snapshot),
+        ("command1_find_intersection", C.command1_find_intersection, [f"%{intersection[:4]}%"], None),
+        ("command2_find_all_cameras", C.command2_find_all_cameras, [intersection], None),
+        ("command3_percentage_by_date", C.command3_percentage_by_date, [lastDate], None),
+        ("command4_cameras_per_intersection", C.command4_cameras_per_intersection, [], None),
+        ("command5_violations_per_intersection", C.command5_violations_per_intersection, [year], None),
+        ("command6_violations_by_year", C.command6_violations_by_year, [str(cameraID), "n"], None),
+        ("command7_violations_by_month", C.command7_violations_by_month, [str(cameraID), year, "n"], None),
+        ("command8_compare_by_day", C.command8_compare_by_day, [year, "n"], None),
+        ("command9_cameras_on_street", C.command9_cameras_on_street, [street, "n"], None),
+    ]
+
+
+def _run_scripted(dbConn, func, answers):
+    script = iter(answers)
+    realInput = builtins.input
+    builtins.input = lambda prompt="": next(script)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            func(dbConn)
+    finally:
+        builtins.input = realInput
+
+
+##################################################################
+#
+# run_benchmark
+#
+# Runs each case warmup times untimed, then repeat times timed, then
+# once more under tracemalloc for its peak memory. Returns one result
+# dict per case with the latencies in milliseconds.
+#
+def run_benchmark(dbConn, cases, repeat, warmup=1):
+    results = []
+    for name, func, answers, setup in cases:
+        for _ in range(warmup):
+            if setup is not None:
+                setup(dbConn)
+            _run_scripted(dbConn, func, answers)
+
+        times = []
+        for _ in range(repeat):
+            if setup is not None:
+                setup(dbConn)
+            start = time.perf_counter()
+            _run_scripted(dbConn, func, answers)
+            times.append((time.perf_counter() - start) * 1000)
+        times.sort()
+
+        if setup is not None:
+            setup(dbConn)
+        tracemalloc.start()
+        _run_scripted(dbConn, func, answers)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results.append({
+            "name": name,
+            "answers": answers,
+            "runs": repeat,
+            "p50_ms": percentile(times, 50),
+            "p95_ms": percentile(times, 95),
+            "max_ms": times[-1],
+            "peak_kib": peak / 1024,
+        })
+    return results
+
+
+##################################################################
+#
+# main
+#
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Chicago traffic commands")
+    parser.add_argument("--db", default="chicago-traffic-cameras.db",
+                        help="database file (default: chicago-traffic-cameras.db)")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per command")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs per command")
+    parser.add_argument("--serial", action="store_true",
+                        help="run red light and speed queries one after the other")
+    parser.add_argument("--json", metavar="FILE", help="also write the results to FILE as JSON")
+    args = parser.parse_args()
+
+    if args.serial:
+        ChicagoTrafficAnalysis.QUERY_SETTINGS["parallel"] = False
+
+    dbConn = ChicagoTrafficAnalysis.connect(args.db)
+    # same startup work as the interactive program:
+    ChicagoTrafficAnalysis.prepare_database(dbConn)
+    results = run_benchmark(dbConn, default_cases(dbConn), args.repeat, args.warmup)
+    dbConn.close()
+
+    print(f"{'command':<40} {'p50 ms':>10} {'p95 ms':>10} {'peak KiB':>10}")
+    for r in results:
+        print(f"{r['name']:<40} {r['p50_ms']:>10.2f} {r['p95_ms']:>10.2f} {r['peak_kib']:>10,.0f}")
+
+    if args.json is not None:
+        with open(args.json, "w") as outFile:
+            json.dump({"db": args.db, "serial": args.serial, "results": results}, outFile, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# Zarak Khan
+# Builds a synthetic Chicago traffic camera database with the same
+# schema as chicago-traffic-cameras.db, at any scale, for testing and
+# benchmarking ChicagoTrafficAnalysis.py.
+#
+# Usage:
+#   python ChicagoTrafficGenerator.py synthetic.db --intersections 2000 \
+#       --cameras 3000 --start 2014-07-01 --days 3650
+#
+# writes roughly cameras * days * density violation rows
+# (about 8 million for the example above).
+
+
+import sqlite3
+import argparse
+import datetime
+import os
+import random
+import time
+
+SCHEMA = """
+CREATE TABLE Intersections (
+    Intersection_ID INTEGER PRIMARY KEY,
+    Intersection TEXT NOT NULL
+);
+CREATE TABLE RedCameras (
+    Camera_ID INTEGER PRIMARY KEY,
+    Intersection_ID INTEGER REFERENCES Intersections (Intersection_ID),
+    Address TEXT,
+    Latitude REAL,
+    Longitude REAL
+);
+CREATE TABLE SpeedCameras (
+    Camera_ID INTEGER PRIMARY KEY,
+    Intersection_ID INTEGER REFERENCES Intersections (Intersection_ID),
+    Address TEXT,
+    Latitude REAL,
+    Longitude REAL
+);
+CREATE TABLE RedViolations (
+    Camera_ID INTEGER REFERENCES RedCameras (Camera_ID),
+    Violation_Date TEXT,
+    Num_Violations INTEGER
+);
+CREATE TABLE SpeedViolations (
+    Camera_ID INTEGER REFERENCES SpeedCameras (Camera_ID),
+    Violation_Date TEXT,
+    Num_Violations INTEGER
+);
+"""
+
+STREETS = [
+    ("ARCHER", "AVE"), ("ASHLAND", "AVE"), ("CALIFORNIA", "AVE"), ("CICERO", "AVE"),
+    ("CLARK", "ST"), ("DAMEN", "AVE"), ("DIVISION", "ST"), ("FULLERTON", "AVE"),
+    ("HALSTED", "ST"), ("IRVING PARK", "RD"), ("JEFFERY", "BLVD"), ("KEDZIE", "AVE"),
+    ("LAKE SHORE", "DR"), ("MADISON", "ST"), ("MICHIGAN", "AVE"), ("MILWAUKEE", "AVE"),
+    ("NORTH", "AVE"), ("PULASKI", "RD"), ("ROOSEVELT", "RD"), ("STONY ISLAND", "AVE"),
+    ("WESTERN", "AVE"), ("CERMAK", "RD"), ("BELMONT", "AVE"), ("LAWRENCE", "AVE"),
+]
+
+DIRECTIONS = ["N", "S", "E", "W"]
+
+# bounding box of the chicago.png map used by command 9
+LONGITUDES = (-87.9277, -87.5569)
+LATITUDES = (41.7012, 42.0868)
+
+BATCH_SIZE = 100000
+
+
+##################################################################
+#
+# generate_cameras
+#
+# Fills Intersections, RedCameras and SpeedCameras. Camera IDs start
+# at 1001; every other camera is a red light camera, the rest are speed
+# cameras. Returns (redCameraIDs, speedCameraIDs).
+#
+def generate_cameras(dbConn, rnd, numIntersections, numCameras):
+    intersections = []
+    for iid in range(1, numIntersections + 1):
+        a, b = rnd.sample(STREETS, 2)
+        intersections.append((iid, f"{a[0]} AND {b[0]}"))
+    dbConn.executemany("INSERT INTO Intersections VALUES (?, ?);", intersections)
+
+    redIDs = []
+    speedIDs = []
+    for cid in range(1001, 1001 + numCameras):
+        iid = rnd.randint(1, numIntersections)
+        name, suffix = rnd.choice(STREETS)
+        address = f"{rnd.randint(1, 12999)} {rnd.choice(DIRECTIONS)} {name} {suffix}"
+        lat = rnd.uniform(*LATITUDES)
+        lng = rnd.uniform(*LONGITUDES)
+        if cid % 2 == 1:
+            table = "RedCameras"
+            redIDs.append(cid)
+        else:
+            table = "SpeedCameras"
+            speedIDs.append(cid)
+        dbConn.execute(f"INSERT INTO {table} VALUES (?, ?, ?, ?, ?);",
+                       [cid, iid, address, lat, lng])
+    return (redIDs, speedIDs)
+
+
+##################################################################
+#
+# generate_violations
+#
+# Writes one row per camera per day with probability density, over
+# numDays days from startDate, into the given violation table.
+# Returns the number of rows written.
+#
+def generate_violations(dbConn, rnd, table, cameraIDs, startDate, numDays, density):
+    sql = f"INSERT INTO {table} VALUES (?, ?, ?);"
+    batch = []
+    total = 0
+    for day in range(numDays):
+        dateStr = (startDate + datetime.timedelta(days=day)).isoformat()
+        for cid in cameraIDs:
+            if rnd.random() < density:
+                batch.append((cid, dateStr, rnd.randint(1, 60)))
+        if len(batch) >= BATCH_SIZE:
+            dbConn.executemany(sql, batch)
+            total += len(batch)
+            batch = []
+    dbConn.executemany(sql, batch)
+    total += len(batch)
+    return total
+
+
+##################################################################
+#
+# generate_database
+#
+# Creates a new database file at path and fills it. Returns the
+# number of (red, speed) violation rows written.
+#
+def generate_database(path, numIntersections, numCameras, startDate, numDays,
+                      density=0.75, seed=341):
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists")
+    rnd = random.Random(seed)
+    dbConn = sqlite3.connect(path)
+    # nothing to protect while the file is being built from scratch:
+    dbConn.execute("PRAGMA journal_mode = OFF;")
+    dbConn.execute("PRAGMA synchronous = OFF;")
+    dbConn.executescript(SCHEMA)
+
+    redIDs, speedIDs = generate_cameras(dbConn, rnd, numIntersections, numCameras)
+    numRed = generate_violations(dbConn, rnd, "RedViolations", redIDs,
+                                 startDate, numDays, density)
+    numSpeed = generate_violations(dbConn, rnd, "SpeedViolations", speedIDs,
+                                   startDate, numDays, density)
+    dbConn.commit()
+    dbConn.close()
+    return (numRed, numSpeed)
+
+
+##################################################################
+#
+# main
+#
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Chicago traffic camera database")
+    parser.add_argument("db", help="database file to create")
+    parser.add_argument("--intersections", type=int, default=500)
+    parser.add_argument("--cameras", type=int, default=400,
+                        help="total cameras, split evenly between red light and speed")
+    parser.add_argument("--start", default="2014-07-01", help="first violation date (YYYY-MM-DD)")
+    parser.add_argument("--days", type=int, default=365 * 5)
+    parser.add_argument("--density", type=float, default=0.75,
+                        help="chance that a camera has a violation row on a given day")
+    parser.add_argument("--seed", type=int, default=341)
+    args = parser.parse_args()
+
+    startDate = datetime.date.fromisoformat(args.start)
+    start = time.perf_counter()
+    try:
+        numRed, numSpeed = generate_database(args.db, args.intersections, args.cameras,
+                                             startDate, args.days, args.density, args.seed)
+    except FileExistsError as e:
+        print("Error:", e)
+        return
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {args.db}: {args.intersections:,} intersections, {args.cameras:,} cameras,")
+    print(f"  {numRed:,} red light and {numSpeed:,} speed violation rows in {elapsed:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# Zarak Khan
+# Loads daily red light and speed violation extracts from the city
+# into the Chicago traffic camera database.
+#
+# Usage:
+#   python ChicagoTrafficIngest.py --type red red-2025-06-01.csv ...
+#   python ChicagoTrafficIngest.py --type speed --db other.db speed.csv
+
+
+import sqlite3
+import argparse
+import csv
+import datetime
+import time
+
+import ChicagoTrafficAnalysis
+
+# --type -> (violation table, camera table it must reference)
+VIOLATION_FEEDS = {
+    "red": ("RedViolations", "RedCameras"),
+    "speed": ("SpeedViolations", "SpeedCameras"),
+}
+
+# normalized header name -> column; headers are compared in upper case
+# with spaces and underscores removed, so "CAMERA ID", "Camera_ID" and
+# "camera id" all name the same column.
+HEADER_COLUMNS = {
+    "CAMERAID": "Camera_ID",
+    "VIOLATIONDATE": "Violation_Date",
+    "VIOLATIONS": "Num_Violations",
+    "NUMVIOLATIONS": "Num_Violations",
+}
+
+DEFAULT_BATCH_SIZE = 50000
+
+
+##################################################################
+#
+# Helper function: normalize_date
+#
+# Returns the date as YYYY-MM-DD given YYYY-MM-DD or MM/DD/YYYY, the
+# two forms the city's extracts use, either of which may be followed by
+# a time (e.g. "2024-03-01T00:00:00.000", "03/01/2024 12:00:00 AM").
+# Returns None if it is neither, or not a real calendar date
+# (e.g. "13/45/2016").
+#
+def normalize_date(text):
+    text = text.strip()
+    if len(text) >= 10 and text[4] == '-' and text[7] == '-':
+        date = text[:10]
+    else:
+        parts = text.split(" ")[0].split("/")
+        if len(parts) != 3 or not parts[0].isdigit() or not parts[1].isdigit():
+            return None
+        month, day, year = parts
+        date = f"{year}-{int(month):02d}-{int(day):02d}"
+    if len(date) != 10 or not (date[:4] + date[5:7] + date[8:10]).isdigit():
+        return None
+    try:
+        datetime.date(int(date[:4]), int(date[5:7]), int(date[8:10]))
+    except ValueError:
+        return None
+    return date
+
+
+##################################################################
+#
+# read_violation_csv
+#
+# Streams (Camera_ID, Violation_Date, Num_Violations) tuples from a
+# violation CSV file with a header row, one row at a time. Rows that
+# cannot be parsed are yielded as None so the caller can count them.
+#
+def read_violation_csv(path):
+    with open(path, newline="") as csvFile:
+        reader = csv.reader(csvFile)
+        header = next(reader, None)
+        if header is None:
+            return
+        positions = {}
+        for i, name in enumerate(header):
+            key = name.strip().upper().replace(" ", "").replace("_", "")
+            if key in HEADER_COLUMNS:
+                positions[HEADER_COLUMNS[key]] = i
+        for column in ["Camera_ID", "Violation_Date", "Num_Violations"]:
+            if column not in positions:
+                raise ValueError(f"{path}: no {column} column in header")
+
+        camPos = positions["Camera_ID"]
+        datePos = positions["Violation_Date"]
+        numPos = positions["Num_Violations"]
+        for row in reader:
+            try:
+                date = normalize_date(row[datePos])
+                if date is None:
+                    yield None
+                else:
+                    yield (int(row[camPos]), date, int(row[numPos]))
+            except (IndexError, ValueError):
+                yield None
+
+
+##################################################################
+#
+# ingest_violations
+#
+# Inserts rows from the given iterable into the violation table for
+# feed ("red" or "speed"). Rows whose camera is not in the feed's camera
+# table, and rows that are None (unparseable), are skipped and counted.
+# Rows are written with executemany in batches of batchSize, each batch
+# in its own explicit transaction, with the database in WAL mode.
+# Afterwards the violation rollups are refreshed.
+#
+# Returns a dict with the counts "read", "inserted", "unknown_camera"
+# and "malformed", plus "seconds" and "rows_per_second" for the load
+# itself and "refresh_seconds" for the rollup refresh after it.
+#
+def ingest_violations(dbConn, feed, rows, batchSize=DEFAULT_BATCH_SIZE):
+    table, cameraTable = VIOLATION_FEEDS[feed]
+    start = time.perf_counter()
+
+    dbConn.execute("PRAGMA journal_mode = WAL;")
+    dbConn.execute("PRAGMA synchronous = NORMAL;")
+
+    cameraIDs = set(r[0] for r in dbConn.execute(f"SELECT Camera_ID FROM {cameraTable};"))
+    sql = f"INSERT INTO {table} (Camera_ID, Violation_Date, Num_Violations) VALUES (?, ?, ?);"
+
+    counts = {"read": 0, "inserted": 0, "unknown_camera": 0, "malformed": 0}
+    batch = []
+
+    def flush():
+        dbConn.execute("BEGIN;")
+        try:
+            dbConn.executemany(sql, batch)
+            dbConn.commit()
+        except sqlite3.Error:
+            dbConn.rollback()
+            raise
+        counts["inserted"] += len(batch)
+        batch.clear()
+
+    for row in rows:
+        counts["read"] += 1
+        if row is None:
+            counts["malformed"] += 1
+        elif row[0] not in cameraIDs:
+            counts["unknown_camera"] += 1
+        else:
+            batch.append(row)
+            if len(batch) >= batchSize:
+                flush()
+    if len(batch) > 0:
+        flush()
+
+    elapsed = time.perf_counter() - start
+    counts["seconds"] = elapsed
+    counts["rows_per_second"] = counts["inserted"] / elapsed if elapsed > 0 else 0.0
+
+    start = time.perf_counter()
+    ChicagoTrafficAnalysis.refresh_rollups(dbConn)
+    counts["refresh_seconds"] = time.perf_counter() - start
+    return counts
+
+
+##################################################################
+#
+# main
+#
+def main():
+    parser = argparse.ArgumentParser(description="Load violation CSV extracts")
+    parser.add_argument("files", nargs="+", metavar="CSV",
+                        help="violation extract with Camera ID, Violation Date and Violations columns")
+    parser.add_argument("--type", choices=sorted(VIOLATION_FEEDS), required=True,
+                        help="red light or speed violations")
+    parser.add_argument("--db", default="chicago-traffic-cameras.db",
+                        help="database file (default: chicago-traffic-cameras.db)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"rows per transaction (default: {DEFAULT_BATCH_SIZE:,})")
+    args = parser.parse_args()
+
+    dbConn = sqlite3.connect(args.db)
+    for path in args.files:
+        try:
+            counts = ingest_violations(dbConn, args.type, read_violation_csv(path), args.batch_size)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            print(f"{path}: ingest failed:", e)
+            continue
+        print(f"{path}:")
+        print("  Rows read:", ChicagoTrafficAnalysis.formatInt(counts["read"]))
+        print("  Rows inserted:", ChicagoTrafficAnalysis.formatInt(counts["inserted"]))
+        print("  Skipped, unknown camera:", ChicagoTrafficAnalysis.formatInt(counts["unknown_camera"]))
+        print("  Skipped, malformed:", ChicagoTrafficAnalysis.formatInt(counts["malformed"]))
+        print(f"  Time: {counts['seconds']:.2f} s ({counts['rows_per_second']:,.0f} rows/s)")
+        print(f"  Rollup refresh: {counts['refresh_seconds']:.2f} s")
+    dbConn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# asynctier.py
+# Asyncio front end for the object tier: the same lookups and updates,
+# run on a bounded thread pool so they don't block the event loop.
+# Zarak Khan
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import datatier
+import objecttier
+
+##################################################################
+#
+# AsyncMovieDB class:
+#
+# Constructor(dbName, max_workers=4, max_concurrency=None, mode="readwrite")
+#
+# Runs objecttier calls on max_workers threads, each with its own
+# connection from a datatier.ConnectionPool opened in the given mode
+# ("readwrite", "readonly" or "memory"; see ConnectionPool). At most max_concurrency
+# calls (default: max_workers) are queued or running at once; further
+# callers wait their turn on the event loop.
+#
+# Cancelling a call that has not started yet drops it; cancelling one
+# that is running interrupts its SQL statement, so the worker is freed
+# promptly (an interrupted write is rolled back).
+#
+# Methods (coroutines) mirror objecttier without the dbConn argument:
+#   num_movies(), num_reviews(),
+#   get_movies(pattern, after_movie_id=None, limit=None),
+#   count_movies(pattern, cap=None), get_movie_details(movie_id),
+#   get_movie_details_many(ids), get_top_N_movies(N, min_num_reviews),
+#   add_review(movie_id, rating), add_reviews(reviews, batch_size),
+#   set_tagline(movie_id, tagline), close()
+#
+# Can be used as "async with AsyncMovieDB(dbName) as db:".
+#
+class AsyncMovieDB:
+    def __init__(self, dbName, max_workers=4, max_concurrency=None, mode="readwrite"):
+        if max_concurrency is None:
+            max_concurrency = max_workers
+        self._pool = datatier.ConnectionPool(dbName, mode=mode)
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="moviedb")
+        self._limit = asyncio.Semaphore(max_concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    # Runs func(pool, *args) on a worker thread and returns its result.
+    async def _run(self, func, *args):
+        # job["dbConn"] is the worker's connection while func is running,
+        # so a cancel can interrupt that call and nothing after it.
+        job = {"dbConn": None}
+        jobLock = threading.Lock()
+
+        def work():
+            with jobLock:
+                job["dbConn"] = self._pool.connection()
+            try:
+                return func(self._pool, *args)
+            finally:
+                with jobLock:
+                    job["dbConn"] = None
+
+        async with self._limit:
+            threadFuture = self._executor.submit(work)
+            future = asyncio.wrap_future(threadFuture)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                with jobLock:
+                    if job["dbConn"] is not None:
+                        job["dbConn"].interrupt()
+                # threadFuture.cancel() only succeeds if work() hasn't started.
+                if not threadFuture.cancel():
+                    # Hold the slot until the interrupted call returns.
+                    await asyncio.wait([future])
+                raise
+
+    async def num_movies(self):
+        return await self._run(objecttier.num_movies)
+
+    async def num_reviews(self):
+        return await self._run(objecttier.num_reviews)
+
+    async def get_movies(self, pattern, after_movie_id=None, limit=None):
+        return await self._run(objecttier.get_movies, pattern, after_movie_id, limit)
+
+    async def count_movies(self, pattern, cap=None):
+        return await self._run(objecttier.count_movies, pattern, cap)
+
+    async def get_movie_details(self, movie_id):
+        return await self._run(objecttier.get_movie_details, movie_id)
+
+    async def get_movie_details_many(self, ids):
+        return await self._run(objecttier.get_movie_details_many, ids)
+
+    async def get_top_N_movies(self, N, min_num_reviews):
+        return await self._run(objecttier.get_top_N_movies, N, min_num_reviews)
+
+    async def add_review(self, movie_id, rating):
+        return await self._run(objecttier.add_review, movie_id, rating)
+
+    async def add_reviews(self, reviews, batch_size=datatier.DEFAULT_COMMIT_SIZE):
+        return await self._run(objecttier.add_reviews, reviews, batch_size)
+
+    async def set_tagline(self, movie_id, tagline):
+        return await self._run(objecttier.set_tagline, movie_id, tagline)
+
+    # Waits for running calls to finish, then closes the connections.
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        self._pool.close()
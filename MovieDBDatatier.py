@@ -2,6 +2,337 @@
 # Executes SQL queries against the given database.
 # Zarak Khan
 import sqlite3
+import contextlib
+import itertools
+import json
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict, deque
+
+# Number of distinct SQL statements each pooled connection keeps a
+# cursor for. This only saves creating cursors: whether a statement is
+# parsed again is up to sqlite3's prepared statement cache, sized by
+# PREPARED_STATEMENT_CACHE_SIZE.
+STATEMENT_CACHE_SIZE = 64
+
+# cached_statements for pooled connections: 128 is sqlite3's default,
+# kept explicit because it must stay above STATEMENT_CACHE_SIZE, with
+# room for statements run without a cached cursor (pragmas,
+# transaction() blocks), or a statement with a cursor here could still
+# be re-parsed.
+PREPARED_STATEMENT_CACHE_SIZE = 128
+
+# mmap_size a read-only ConnectionPool uses unless told otherwise:
+# enough to map the whole MovieLens database.
+READONLY_MMAP_SIZE = 1073741824
+
+# Rows select_iter fetches from sqlite3 at a time.
+DEFAULT_FETCH_SIZE = 256
+
+# Rows perform_many writes per transaction.
+DEFAULT_COMMIT_SIZE = 10000
+
+# Query instrumentation: "enabled" turns the per-statement counters on
+# or off; "slow_ms" is the slow query threshold in milliseconds (None
+# turns the slow query log off); "slow_log_size" is how many of the
+# most recent slow queries are kept.
+QUERY_STATS_SETTINGS = {"enabled": True, "slow_ms": None, "slow_log_size": 100}
+
+_queryStats = {}
+_slowQueries = deque(maxlen=QUERY_STATS_SETTINGS["slow_log_size"])
+_queryStatsLock = threading.Lock()
+
+# id()s of the connections inside a transaction() block, where
+# perform_action and perform_many leave committing to the block.
+_openTransactions = set()
+# id(connection) -> callbacks to run when its transaction() block ends
+_transactionCallbacks = {}
+
+# Statement cache counters, across all pooled connections.
+_statementStats = {"hits": 0, "misses": 0}
+_statementStatsLock = threading.Lock()
+
+##################################################################
+#
+# Helper function: _record_query
+#
+# Adds one run of sql, which took seconds and returned (or changed)
+# rows rows, to the query statistics. If it was slower than the slow
+# query threshold, also logs it with its EXPLAIN QUERY PLAN, run on
+# dbConn with the same parameters.
+#
+def _record_query(dbConn, sql, parameters, seconds, rows):
+    if not QUERY_STATS_SETTINGS["enabled"]:
+        return
+    ms = seconds * 1000
+    key = " ".join(sql.split())
+    with _queryStatsLock:
+        stats = _queryStats.get(key)
+        if stats is None:
+            stats = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0}
+            _queryStats[key] = stats
+        stats["calls"] += 1
+        stats["total_ms"] += ms
+        stats["max_ms"] = max(stats["max_ms"], ms)
+        stats["rows"] += max(rows, 0)
+
+    slowMs = QUERY_STATS_SETTINGS["slow_ms"]
+    if slowMs is None or ms < slowMs:
+        return
+    try:
+        if parameters is None:
+            plan = dbConn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+        else:
+            plan = dbConn.execute("EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+        plan = [row[3] for row in plan]
+    except Exception as e:
+        plan = ["EXPLAIN QUERY PLAN failed: {}".format(e)]
+    entry = {
+        "sql": key,
+        "parameters": list(parameters) if parameters is not None else None,
+        "ms": ms,
+        "rows": rows,
+        "plan": plan,
+        "time": time.time(),
+    }
+    global _slowQueries
+    with _queryStatsLock:
+        if _slowQueries.maxlen != QUERY_STATS_SETTINGS["slow_log_size"]:
+            _slowQueries = deque(_slowQueries, maxlen=QUERY_STATS_SETTINGS["slow_log_size"])
+        _slowQueries.append(entry)
+
+##################################################################
+#
+# query_stats:
+#
+# Returns a snapshot of the query statistics as a dict with
+#   "statements": SQL text (whitespace collapsed) -> dict with "calls",
+#                 "total_ms", "max_ms", "avg_ms" and "rows"
+#   "slow_queries": the logged slow queries, oldest first, each a dict
+#                 with "sql", "parameters", "ms", "rows", "plan" (the
+#                 EXPLAIN QUERY PLAN lines) and "time"
+# reset_query_stats() clears both; export_query_stats(fileName) writes
+# the snapshot to fileName as JSON.
+#
+def query_stats():
+    with _queryStatsLock:
+        statements = {}
+        for key, stats in _queryStats.items():
+            stats = dict(stats)
+            stats["avg_ms"] = stats["total_ms"] / stats["calls"]
+            statements[key] = stats
+        return {"statements": statements, "slow_queries": list(_slowQueries)}
+
+def reset_query_stats():
+    with _queryStatsLock:
+        _queryStats.clear()
+        _slowQueries.clear()
+
+def export_query_stats(fileName):
+    with open(fileName, "w") as outFile:
+        json.dump(query_stats(), outFile, indent=2)
+
+##################################################################
+#
+# _CachingConnection class:
+#
+# The connection class a ConnectionPool opens. Keeps one cursor per
+# distinct SQL text, least recently used first, so repeated statements
+# reuse their cursor (sqlite3 reuses the prepared statement itself, see
+# PREPARED_STATEMENT_CACHE_SIZE).
+#
+class _CachingConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cursors = OrderedDict()
+        # see database_info
+        self.info = {}
+
+    # Returns the cursor for sql, creating it on a miss.
+    def cached_cursor(self, sql):
+        cursor = self._cursors.get(sql)
+        with _statementStatsLock:
+            if cursor is None:
+                _statementStats["misses"] += 1
+            else:
+                _statementStats["hits"] += 1
+        if cursor is None:
+            cursor = self.cursor()
+            self._cursors[sql] = cursor
+            if len(self._cursors) > STATEMENT_CACHE_SIZE:
+                self._cursors.popitem(last=False)[1].close()
+        else:
+            self._cursors.move_to_end(sql)
+        return cursor
+
+    # Closes and forgets the cursor for sql.
+    def discard_cursor(self, sql):
+        cursor = self._cursors.pop(sql, None)
+        if cursor is not None:
+            cursor.close()
+
+##################################################################
+#
+# statement_cache_stats:
+#
+# Returns a dict with the statement cache "hits" and "misses" so far:
+# how often a pooled connection found a cursor already cached for the
+# SQL (see _CachingConnection) or had to create one. They count cursor
+# reuse, not parses; sqlite3 doesn't report those.
+# reset_statement_cache_stats() sets both back to 0.
+#
+def statement_cache_stats():
+    with _statementStatsLock:
+        return dict(_statementStats)
+
+def reset_statement_cache_stats():
+    with _statementStatsLock:
+        _statementStats["hits"] = 0
+        _statementStats["misses"] = 0
+
+##################################################################
+#
+# ConnectionPool class:
+#
+# Hands out one connection per thread to the same database file, so
+# several threads can query it in parallel (a sqlite3 connection must
+# not be shared between threads). Each connection is opened the first
+# time its thread asks for one and is set up with:
+#   journal_mode = WAL   readers and the writer don't block each other
+#   busy_timeout         milliseconds to wait on a locked database
+#   cache_size           page cache per connection (negative = KiB)
+#   mmap_size            bytes of the file to memory-map for reads
+# and reuses a cursor per statement (see STATEMENT_CACHE_SIZE).
+#
+# mode is one of
+#   "readwrite"  the default, as above
+#   "readonly"   opens the file with mode=ro&immutable=1, so SQLite
+#                takes no locks and never checks for changes, and maps
+#                READONLY_MMAP_SIZE bytes of it by default; writes fail.
+#                It does not read a -wal file, so no writer may have the
+#                database open
+#   "memory"     copies the whole file into a shared in-memory database
+#                with the backup API when the pool is created; queries
+#                then never touch the disk, and writes last only until
+#                the pool is closed
+#
+# A pool can be passed anywhere a dbConn is expected; select_one_row,
+# select_n_rows and perform_action check out the calling thread's
+# connection themselves. close() closes every connection handed out.
+#
+class ConnectionPool:
+    MODES = ["readwrite", "readonly", "memory"]
+
+    def __init__(self, dbName, mode="readwrite", busy_timeout=5000, cache_size=-16384,
+                 mmap_size=None):
+        if mode not in ConnectionPool.MODES:
+            raise ValueError("unknown mode {!r}".format(mode))
+        if mmap_size is None:
+            mmap_size = READONLY_MMAP_SIZE if mode == "readonly" else 268435456
+        self._mode = mode
+        self._pragmas = [
+            "PRAGMA busy_timeout = {};".format(int(busy_timeout)),
+            "PRAGMA cache_size = {};".format(int(cache_size)),
+        ]
+        fileURI = "file:{}".format(urllib.parse.quote(dbName))
+        if mode == "readwrite":
+            self._dbName = dbName
+            self._pragmas.insert(0, "PRAGMA journal_mode = WAL;")
+            self._pragmas.append("PRAGMA mmap_size = {};".format(int(mmap_size)))
+        elif mode == "readonly":
+            self._dbName = fileURI + "?mode=ro&immutable=1"
+            self._pragmas.append("PRAGMA mmap_size = {};".format(int(mmap_size)))
+        else:
+            # Every connection opened with this name shares one database,
+            # which lives as long as any of them is open.
+            self._dbName = "file:moviedb-{}?mode=memory&cache=shared".format(id(self))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        # see database_info
+        self._info = {}
+        # Open the creating thread's connection now, so a bad database
+        # name fails here rather than on the first query.
+        dbConn = self.connection()
+        if mode == "memory":
+            source = sqlite3.connect(fileURI + "?mode=ro", uri=True)
+            try:
+                source.backup(dbConn)
+            finally:
+                source.close()
+
+    @property
+    def Mode(self):
+        return self._mode
+
+    # Returns the calling thread's connection, opening it if needed.
+    def connection(self):
+        dbConn = getattr(self._local, "dbConn", None)
+        if dbConn is None:
+            # check_same_thread is off only so close() can run on any
+            # thread; each connection is otherwise used by its own thread.
+            dbConn = sqlite3.connect(self._dbName, uri=(self._mode != "readwrite"),
+                                     check_same_thread=False,
+                                     factory=_CachingConnection,
+                                     cached_statements=PREPARED_STATEMENT_CACHE_SIZE)
+            for pragma in self._pragmas:
+                dbConn.execute(pragma)
+            self._local.dbConn = dbConn
+            with self._lock:
+                self._connections.append(dbConn)
+        return dbConn
+
+    # Closes every connection the pool has handed out.
+    def close(self):
+        with self._lock:
+            for dbConn in self._connections:
+                dbConn.close()
+            self._connections = []
+            self._local = threading.local()
+            self._info = {}
+
+##################################################################
+#
+# Helper function: _checkout
+#
+# Returns the connection to use for dbConn, which is either a
+# connection or a ConnectionPool.
+#
+def _checkout(dbConn):
+    if isinstance(dbConn, ConnectionPool):
+        return dbConn.connection()
+    return dbConn
+
+##################################################################
+#
+# database_info:
+#
+# Returns a dict in which callers can remember facts about the
+# database behind dbConn (its file name, which optional tables it has)
+# instead of asking SQLite on every call. A ConnectionPool keeps one
+# dict for all its connections until it is closed, and a connection
+# it opened keeps its own; for any other connection the dict is new on
+# each call, so nothing is remembered.
+#
+def database_info(dbConn):
+    if isinstance(dbConn, ConnectionPool):
+        return dbConn._info
+    if isinstance(dbConn, _CachingConnection):
+        return dbConn.info
+    return {}
+
+##################################################################
+#
+# Helper function: _cursor
+#
+# Returns a cursor to run sql on: the cached one for pooled
+# connections, a new one otherwise.
+#
+def _cursor(dbConn, sql):
+    if isinstance(dbConn, _CachingConnection):
+        return dbConn.cached_cursor(sql)
+    return dbConn.cursor()
 
 ##################################################################
 #
@@ -9,19 +340,32 @@ import sqlite3
 #
 # Executes a SQL SELECT query and returns the first row.
 # If no row is found, returns an empty tuple. In case of an error,
-# prints an error message and returns None.
+# prints an error message and returns None. dbConn may be a
+# connection or a ConnectionPool. Like every query function here,
+# successful runs are recorded in the query statistics (see
+# query_stats).
 #
 def select_one_row(dbConn, sql, parameters=None):
     try:
-        # Create a cursor object to interact with the database.
-        cursor = dbConn.cursor()
+        dbConn = _checkout(dbConn)
+        # Get a cursor object to interact with the database.
+        cursor = _cursor(dbConn, sql)
         # Execute the SQL query with or without parameters.
+        start = time.perf_counter()
         if parameters is None:
             cursor.execute(sql)
         else:
             cursor.execute(sql, parameters)
         # Retrieve the first row from the query result.
         row = cursor.fetchone()
+        _record_query(dbConn, sql, parameters, time.perf_counter() - start,
+                      0 if row is None else 1)
+        # A cached cursor outlives this call, so it must not be left
+        # part-way through a result (that would hold the read open).
+        # Single-row queries finish on the next fetch; otherwise drop it.
+        if row is not None and isinstance(dbConn, _CachingConnection):
+            if cursor.fetchone() is not None:
+                dbConn.discard_cursor(sql)
         # Return the row if found; otherwise, return an empty tuple.
         return row if row is not None else ()
     except Exception as e:
@@ -35,25 +379,83 @@ def select_one_row(dbConn, sql, parameters=None):
 #
 # Executes a SQL SELECT query and returns all rows as a list.
 # If no rows are found, returns an empty list. In case of an error,
-# prints an error message and returns None.
+# prints an error message and returns None. dbConn may be a
+# connection or a ConnectionPool. If row_factory is given, each row
+# is returned as row_factory(cursor, row) (see sqlite3's
+# Cursor.row_factory) rather than as a tuple.
 #
-def select_n_rows(dbConn, sql, parameters=None):
+def select_n_rows(dbConn, sql, parameters=None, row_factory=None):
     try:
-        # Create a cursor object for executing SQL commands.
-        cursor = dbConn.cursor()
+        dbConn = _checkout(dbConn)
+        # Get a cursor object for executing SQL commands.
+        cursor = _cursor(dbConn, sql)
+        # Set every time, since a cached cursor keeps the last one.
+        cursor.row_factory = row_factory if row_factory is not None else dbConn.row_factory
         # Execute the query, using parameters if provided.
+        start = time.perf_counter()
         if parameters is None:
             cursor.execute(sql)
         else:
             cursor.execute(sql, parameters)
         # Fetch all rows from the result set.
         rows = cursor.fetchall()
+        _record_query(dbConn, sql, parameters, time.perf_counter() - start, len(rows))
         return rows
     except Exception as e:
         # Print error message and return None on failure.
         print("select_n_rows failed:", e)
         return None
 
+##################################################################
+#
+# select_iter:
+#
+# Executes a SQL SELECT query and returns a generator over its rows,
+# fetched batch_size rows at a time, so a caller can stop early and
+# never holds more than one batch in memory. In case of an error
+# running the query, prints an error message and returns None; an
+# error while fetching prints a message and ends the rows. The rows
+# must be read on the thread that called select_iter. dbConn may be a
+# connection or a ConnectionPool. row_factory is as for select_n_rows.
+#
+def select_iter(dbConn, sql, parameters=None, batch_size=DEFAULT_FETCH_SIZE, row_factory=None):
+    try:
+        dbConn = _checkout(dbConn)
+        # A cursor of its own: the cached ones are reused by the next call
+        # while this one is still being read.
+        cursor = dbConn.cursor()
+        if row_factory is not None:
+            cursor.row_factory = row_factory
+        start = time.perf_counter()
+        if parameters is None:
+            cursor.execute(sql)
+        else:
+            cursor.execute(sql, parameters)
+        seconds = time.perf_counter() - start
+    except Exception as e:
+        print("select_iter failed:", e)
+        return None
+    return _iter_rows(dbConn, cursor, sql, parameters, batch_size, seconds)
+
+# Time spent by the caller between batches is not counted.
+def _iter_rows(dbConn, cursor, sql, parameters, batch_size, seconds):
+    count = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            rows = cursor.fetchmany(batch_size)
+            seconds += time.perf_counter() - start
+            if not rows:
+                break
+            count += len(rows)
+            yield from rows
+    except Exception as e:
+        print("select_iter failed:", e)
+    finally:
+        # Ends the read even if the caller stopped early.
+        cursor.close()
+        _record_query(dbConn, sql, parameters, seconds, count)
+
 ##################################################################
 #
 # perform_action:
@@ -61,21 +463,130 @@ def select_n_rows(dbConn, sql, parameters=None):
 # Executes a SQL action query (INSERT, UPDATE, or DELETE) and returns 
 # the number of rows affected. A return value of 0 means no rows were changed.
 # In case of an error, prints an error message and returns -1.
+# dbConn may be a connection or a ConnectionPool. Inside a
+# transaction() block the change is committed with the block.
 #
 def perform_action(dbConn, sql, parameters=None):
     try:
-        # Create a cursor to execute the SQL command.
-        cursor = dbConn.cursor()
+        dbConn = _checkout(dbConn)
+        # Get a cursor to execute the SQL command.
+        cursor = _cursor(dbConn, sql)
         # Execute the action query, with parameters if provided.
+        start = time.perf_counter()
         if parameters is None:
             cursor.execute(sql)
         else:
             cursor.execute(sql, parameters)
-        # Commit the transaction to save changes to the database.
-        dbConn.commit()
+        # Commit the transaction to save changes to the database,
+        # unless a transaction() block will commit it.
+        if id(dbConn) not in _openTransactions:
+            dbConn.commit()
+        _record_query(dbConn, sql, parameters, time.perf_counter() - start, cursor.rowcount)
         # Return the number of rows modified.
         return cursor.rowcount
     except Exception as e:
         # Print error message and return -1 if an error occurs.
         print("perform_action failed:", e)
-        return -1
\ No newline at end of file
+        return -1
+
+##################################################################
+#
+# transaction:
+#
+# Context manager that runs the enclosed perform_action and
+# perform_many calls on dbConn as one transaction: committed when the
+# block ends, rolled back if it raises. Calls that fail still only
+# print and return -1, so check their results before leaving the block.
+# A transaction() inside another on the same connection joins it.
+# Yields the connection in use (the calling thread's, for a pool).
+#
+@contextlib.contextmanager
+def transaction(dbConn):
+    dbConn = _checkout(dbConn)
+    if id(dbConn) in _openTransactions:
+        yield dbConn
+        return
+    dbConn.execute("BEGIN")
+    _openTransactions.add(id(dbConn))
+    try:
+        try:
+            yield dbConn
+        except BaseException:
+            _openTransactions.discard(id(dbConn))
+            dbConn.rollback()
+            raise
+        _openTransactions.discard(id(dbConn))
+        dbConn.commit()
+    finally:
+        for callback in _transactionCallbacks.pop(id(dbConn), []):
+            callback()
+
+##################################################################
+#
+# in_transaction:
+#
+# Returns True if dbConn (for a pool, the calling thread's connection)
+# is inside a transaction() block.
+#
+def in_transaction(dbConn):
+    return id(_checkout(dbConn)) in _openTransactions
+
+##################################################################
+#
+# after_transaction:
+#
+# Calls callback() when the transaction() block dbConn is in ends,
+# after it commits or rolls back, or right away if dbConn is not in
+# one. Lets callers that keep copies of the data wait until a change
+# is visible to other connections before refreshing them.
+#
+def after_transaction(dbConn, callback):
+    dbConn = _checkout(dbConn)
+    if id(dbConn) not in _openTransactions:
+        callback()
+        return
+    _transactionCallbacks.setdefault(id(dbConn), []).append(callback)
+
+##################################################################
+#
+# perform_many:
+#
+# Executes a SQL action query once for each parameter tuple in
+# parameter_seq (any iterable) with executemany, and returns the total
+# number of rows affected. Rows are written batch_size at a time, each
+# batch in its own transaction, so a bulk load pays for one commit per
+# batch rather than one per row. Inside a transaction() block nothing
+# is committed until the block ends. Each batch also runs under a
+# SAVEPOINT, so in case of an error the batch in progress is rolled
+# back even inside an enclosing transaction() (earlier batches, and
+# the block's other work, stay); then prints an error message and
+# returns -1. Each batch counts as one call in
+# the query statistics, and a slow batch is logged with its first row
+# of parameters.
+#
+def perform_many(dbConn, sql, parameter_seq, batch_size=DEFAULT_COMMIT_SIZE):
+    try:
+        dbConn = _checkout(dbConn)
+        cursor = _cursor(dbConn, sql)
+        total = 0
+        parameter_seq = iter(parameter_seq)
+        while True:
+            batch = list(itertools.islice(parameter_seq, batch_size))
+            if not batch:
+                break
+            start = time.perf_counter()
+            with transaction(dbConn):
+                dbConn.execute("SAVEPOINT perform_many")
+                try:
+                    cursor.executemany(sql, batch)
+                except BaseException:
+                    dbConn.execute("ROLLBACK TO perform_many")
+                    raise
+                finally:
+                    dbConn.execute("RELEASE perform_many")
+            _record_query(dbConn, sql, batch[0], time.perf_counter() - start, cursor.rowcount)
+            total += cursor.rowcount
+        return total
+    except Exception as e:
+        print("perform_many failed:", e)
+        return -1
@@ -3,8 +3,25 @@
 # the data tier.
 # Zarak Khan
 
+import json
+import bisect
+import threading
+import time
+from collections import OrderedDict
+
 import datatier
 
+# Top-N cache (see get_top_N_movies): "enabled" turns it on or off;
+# "max_thresholds" is how many min_num_reviews values are kept ranked
+# per database, least recently used dropped first.
+TOP_N_CACHE_SETTINGS = {"enabled": True, "max_thresholds": 16}
+
+# Movie details cache (see get_movie_details): "enabled" turns it on or
+# off; "max_size" is how many movies it holds, least recently used
+# evicted first; "ttl" is how many seconds an entry stays valid (None
+# means until a write through this module invalidates it).
+DETAILS_CACHE_SETTINGS = {"enabled": True, "max_size": 4096, "ttl": None}
+
 ##################################################################
 #
 # Movie class:
@@ -16,6 +33,9 @@ import datatier
 #   Release_Year: string
 #
 class Movie:
+    # No per-object __dict__: these are built by the thousand.
+    __slots__ = ("_movie_id", "_title", "_release_year")
+
     def __init__(self, movie_id, title, release_year):
         # Store values in private attributes.
         self._movie_id = movie_id
@@ -47,6 +67,8 @@ class Movie:
 #   Avg_Rating: float
 #
 class MovieRating:
+    __slots__ = ("_movie_id", "_title", "_release_year", "_num_reviews", "_avg_rating")
+
     def __init__(self, movie_id, title, release_year, num_reviews, avg_rating):
         # Store values in private attributes.
         self._movie_id = movie_id
@@ -95,6 +117,10 @@ class MovieRating:
 #   Production_Companies: list
 #
 class MovieDetails:
+    __slots__ = ("_movie_id", "_title", "_release_date", "_runtime", "_original_language",
+                 "_budget", "_revenue", "_num_reviews", "_avg_rating", "_tagline",
+                 "_genres", "_production_companies")
+
     def __init__(self, movie_id, title, release_date, runtime, original_language,
                  budget, revenue, num_reviews, avg_rating, tagline, genres, production_companies):
         # Store detailed movie info in private attributes.
@@ -159,6 +185,17 @@ class MovieDetails:
     def Production_Companies(self):
         return self._production_companies
 
+##################################################################
+#
+# Row factories (sqlite3 row_factory signature) that build the objects
+# above straight from query rows whose columns are in constructor order.
+#
+def _movie_row(cursor, row):
+    return Movie(*row)
+
+def _movie_rating_row(cursor, row):
+    return MovieRating(*row)
+
 ##################################################################
 #
 # num_movies:
@@ -193,25 +230,72 @@ def num_reviews(dbConn):
 #
 # Finds and returns all movies whose names are "like"
 # the pattern. Patterns are based on SQL wildcards (_ and %).
-# Pass "%" to get all movies.
+# Pass "%" to get all movies. Uses the title search indexes where they
+# help (see _title_predicate); the results are the same either way.
+#
+# For one page at a time, pass limit (the page size) and, for every
+# page after the first, after_movie_id = the last Movie_ID of the
+# previous page. Each page starts where the last one ended in the
+# Movie_ID primary key, so it costs the same however deep it is.
 #
 # Returns: list of Movie objects in ascending order by ID, or
 #          an empty list if no data is retrieved or an error occurs.
 #
-def get_movies(dbConn, pattern):
+def get_movies(dbConn, pattern, after_movie_id=None, limit=None):
     # SQL query: extract movie ID, title, and release year from Release_Date.
+    where, parameters = _title_predicate(dbConn, pattern)
     sql = ("SELECT Movie_ID, Title, substr(Release_Date, 1, 4) as Release_Year " 
-           "FROM Movies WHERE Title LIKE ? ORDER BY Movie_ID ASC")
-    rows = datatier.select_n_rows(dbConn, sql, [pattern])
-    movies = []
-    if rows is None:
+           "FROM Movies WHERE " + where)
+    if after_movie_id is not None:
+        sql += " AND Movie_ID > ?"
+        parameters.append(after_movie_id)
+    sql += " ORDER BY Movie_ID ASC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        parameters.append(limit)
+    # Each row comes back as a Movie object.
+    movies = datatier.select_n_rows(dbConn, sql, parameters, row_factory=_movie_row)
+    if movies is None:
         return []
-    # Create a Movie object for each row returned.
-    for row in rows:
-        movie = Movie(row[0], row[1], row[2])
-        movies.append(movie)
     return movies
 
+##################################################################
+#
+# count_movies:
+#
+# Returns the number of movies whose names are "like" the pattern,
+# without building them. If cap is given, counting stops once cap
+# matches are found, so the result is min(matches, cap) -- enough to
+# tell "more than cap" apart without scanning the rest.
+# Returns -1 if an error occurs.
+#
+def count_movies(dbConn, pattern, cap=None):
+    where, parameters = _title_predicate(dbConn, pattern)
+    sql = ("SELECT COUNT(*) FROM "
+           "(SELECT 1 FROM Movies WHERE " + where + " LIMIT ?)")
+    parameters.append(-1 if cap is None else cap)
+    result = datatier.select_one_row(dbConn, sql, parameters)
+    if result is None or result == ():
+        return -1
+    return result[0]
+
+##################################################################
+#
+# iter_movies:
+#
+# Lazy version of get_movies: yields the matching Movie objects one
+# at a time, in ascending order by ID, reading rows from the database
+# in batches of batch_size. Yields nothing if an error occurs.
+#
+def iter_movies(dbConn, pattern, batch_size=datatier.DEFAULT_FETCH_SIZE):
+    where, parameters = _title_predicate(dbConn, pattern)
+    sql = ("SELECT Movie_ID, Title, substr(Release_Date, 1, 4) as Release_Year " 
+           "FROM Movies WHERE " + where + " ORDER BY Movie_ID ASC")
+    movies = datatier.select_iter(dbConn, sql, parameters, batch_size, row_factory=_movie_row)
+    if movies is None:
+        return
+    yield from movies
+
 ##################################################################
 #
 # get_movie_details:
@@ -219,131 +303,981 @@ def get_movies(dbConn, pattern):
 # Finds and returns detailed information about the given movie.
 # The movie ID is passed as a parameter and the function returns
 # a MovieDetails object. If no movie is found, returns None.
+# Answered from the details cache when it is enabled (see below).
 #
 def get_movie_details(dbConn, movie_id):
-    # Get basic movie info.
-    sql_movie = ("SELECT Movie_ID, Title, Release_Date, Runtime, Original_Language, "
-                 "Budget, Revenue FROM Movies WHERE Movie_ID = ?")
-    movie_row = datatier.select_one_row(dbConn, sql_movie, [movie_id])
-    if movie_row is None or movie_row == ():
-        return None
-    movie_id_val, title, release_date, runtime, original_language, budget, revenue = movie_row
-
-    # Trim the release date to remove any time component.
-    # For example, "1966-09-15 00:00:00.000" becomes "1966-09-15".
-    if isinstance(release_date, str) and " " in release_date:
-        release_date = release_date.split()[0]
-
-    # Get review statistics.
-    sql_reviews = "SELECT COUNT(*), AVG(Rating) FROM Ratings WHERE Movie_ID = ?"
-    review_row = datatier.select_one_row(dbConn, sql_reviews, [movie_id])
-    if review_row is None:
-        num_reviews_val = 0
-        avg_rating_val = 0.0
+    return get_movie_details_many(dbConn, [movie_id])[0]
+
+# Movie row, review statistics, tagline, and the genres and production
+# companies (each as a JSON array, in name order) of every movie whose
+# ID is in the JSON array parameter, in one query, each row led by the
+# position of its ID in the array. SQLite matches the IDs against the
+# INTEGER Movie_ID column, so "3" finds movie 3 just as 3 does.
+# {reviews} is one of the two _SQL_REVIEWS_* tables below.
+_SQL_MOVIE_DETAILS = """
+    SELECT J.key, M.Movie_ID, M.Title, M.Release_Date, M.Runtime, M.Original_Language,
+           M.Budget, M.Revenue,
+           IFNULL(R.Num_Reviews, 0), IFNULL(R.Avg_Rating, 0.0),
+           IFNULL((SELECT T.Tagline FROM Movie_Taglines T WHERE T.Movie_ID = M.Movie_ID), ''),
+           (SELECT json_group_array(Genre_Name) FROM
+              (SELECT G.Genre_Name FROM Movie_Genres MG
+               JOIN Genres G ON MG.Genre_ID = G.Genre_ID
+               WHERE MG.Movie_ID = M.Movie_ID ORDER BY G.Genre_Name ASC)),
+           (SELECT json_group_array(Company_Name) FROM
+              (SELECT C.Company_Name FROM Movie_Production_Companies MPC
+               JOIN Companies C ON MPC.Company_ID = C.Company_ID
+               WHERE MPC.Movie_ID = M.Movie_ID ORDER BY C.Company_Name ASC))
+    FROM json_each(?1) J
+    JOIN Movies M ON M.Movie_ID = J.value
+    LEFT JOIN {reviews} R ON R.Movie_ID = M.Movie_ID
+"""
+
+# Reviews counted in one pass over Ratings for all the movies together.
+_SQL_REVIEWS_RATINGS = """
+    (SELECT Movie_ID, COUNT(Rating) AS Num_Reviews, AVG(Rating) AS Avg_Rating
+     FROM Ratings
+     WHERE Movie_ID IN (SELECT value FROM json_each(?1))
+     GROUP BY Movie_ID)"""
+
+# Reviews looked up in Movie_Rating_Stats, one row per movie.
+_SQL_REVIEWS_STATS = """
+    (SELECT Movie_ID, Num_Reviews, CAST(Sum_Ratings AS REAL) / Num_Reviews AS Avg_Rating
+     FROM Movie_Rating_Stats)"""
+
+##################################################################
+#
+# get_movie_details_many:
+#
+# Batch version of get_movie_details: returns a list with one entry
+# per movie ID in ids, in the same order -- a MovieDetails object, or
+# None if no movie has that ID. However many IDs are given, this is a
+# single query (for the IDs not in the details cache).
+#
+def get_movie_details_many(dbConn, ids):
+    ids = list(ids)
+    results = [None] * len(ids)
+    keys = [_movie_key(movie_id) for movie_id in ids]
+    dbFile = _details_cache_file(dbConn)
+    cached = {}
+    if dbFile is not None:
+        cached = _details_cache_get(dbFile, [key for key in keys if key is not None])
+    missing = []
+    for i, key in enumerate(keys):
+        if key in cached:
+            results[i] = cached[key]
+        else:
+            missing.append(i)
+    if missing:
+        loadedAt = _details_cache_clock()
+        loaded = _load_movie_details(dbConn, [ids[i] for i in missing])
+        if dbFile is not None:
+            _details_cache_put(dbFile, {movie.Movie_ID: movie for movie in loaded
+                                        if movie is not None}, loadedAt)
+        for i, movie in zip(missing, loaded):
+            results[i] = movie
+    return results
+
+# The Movie_ID that movie_id stands for when it is a whole number (an
+# int, or a string of digits), for the details cache; None for any
+# other value, which the query is left to match as SQLite sees fit.
+def _movie_key(movie_id):
+    if isinstance(movie_id, int):
+        return int(movie_id)
+    if isinstance(movie_id, float) and movie_id.is_integer():
+        return int(movie_id)
+    if isinstance(movie_id, str):
+        digits = movie_id.strip()
+        if digits[:1] in ("+", "-"):
+            digits = digits[1:]
+        if digits.isascii() and digits.isdigit():
+            return int(movie_id)
+    return None
+
+# Runs the details query for ids and returns a list with a MovieDetails
+# object or None for each of them, in order (all None if an error
+# occurs). An ID that isn't a JSON value (bytes, say) finds nothing.
+def _load_movie_details(dbConn, ids):
+    if has_rating_stats(dbConn):
+        sql = _SQL_MOVIE_DETAILS.format(reviews=_SQL_REVIEWS_STATS)
     else:
-        num_reviews_val = review_row[0] if review_row[0] is not None else 0
-        avg_rating_val = review_row[1] if review_row[1] is not None else 0.0
-
-    # Get tagline.
-    sql_tagline = "SELECT Tagline FROM Movie_Taglines WHERE Movie_ID = ?"
-    tagline_row = datatier.select_one_row(dbConn, sql_tagline, [movie_id])
-    tagline_val = tagline_row[0] if tagline_row and tagline_row != () else ""
-
-    # Get genres.
-    sql_genres = ("SELECT G.Genre_Name FROM Movie_Genres MG "
-                  "JOIN Genres G ON MG.Genre_ID = G.Genre_ID "
-                  "WHERE MG.Movie_ID = ? ORDER BY G.Genre_Name ASC")
-    genre_rows = datatier.select_n_rows(dbConn, sql_genres, [movie_id])
-    genres = [row[0] for row in genre_rows] if genre_rows is not None else []
-
-    # Get production companies.
-    sql_companies = ("SELECT C.Company_Name FROM Movie_Production_Companies MPC "
-                     "JOIN Companies C ON MPC.Company_ID = C.Company_ID "
-                     "WHERE MPC.Movie_ID = ? ORDER BY C.Company_Name ASC")
-    company_rows = datatier.select_n_rows(dbConn, sql_companies, [movie_id])
-    production_companies = [row[0] for row in company_rows] if company_rows is not None else []
-
-    # Construct and return a MovieDetails object.
-    return MovieDetails(movie_id_val, title, release_date, runtime, original_language,
-                        budget, revenue, num_reviews_val, avg_rating_val, tagline_val,
-                        genres, production_companies)
+        sql = _SQL_MOVIE_DETAILS.format(reviews=_SQL_REVIEWS_RATINGS)
+    values = []
+    for movie_id in ids:
+        try:
+            values.append(json.dumps(movie_id, allow_nan=False))
+        except (TypeError, ValueError):
+            values.append("null")
+    details = [None] * len(ids)
+    rows = datatier.select_n_rows(dbConn, sql, ["[" + ",".join(values) + "]"])
+    if rows is None:
+        return details
+
+    for row in rows:
+        (position, movie_id_val, title, release_date, runtime, original_language, budget, revenue,
+         num_reviews_val, avg_rating_val, tagline_val, genres_json, companies_json) = row
 
+        # Trim the release date to remove any time component.
+        # For example, "1966-09-15 00:00:00.000" becomes "1966-09-15".
+        if isinstance(release_date, str) and " " in release_date:
+            release_date = release_date.split()[0]
+
+        details[position] = MovieDetails(movie_id_val, title, release_date, runtime,
+                                         original_language, budget, revenue,
+                                         num_reviews_val, avg_rating_val, tagline_val,
+                                         json.loads(genres_json), json.loads(companies_json))
+    return details
 
 ##################################################################
 #
-# get_top_N_movies:
+# Movie details cache:
 #
-# Finds and returns the top N movies based on their average
-# rating, where each movie has at least the specified number of reviews.
+# An LRU cache of MovieDetails objects keyed by (database file, movie
+# ID), holding at most DETAILS_CACHE_SETTINGS["max_size"] movies, each
+# for at most "ttl" seconds if set. Only movies that exist are cached.
+# add_review and set_tagline invalidate just the movie they change;
+# add_reviews clears the database's entries. A load that was running
+# when one of its movies was invalidated is not cached. Reads inside a
+# datatier.transaction() block bypass the cache, since what they see
+# may yet be rolled back, and changes made inside one are invalidated
+# again when the block ends. Each caller gets its own Genres and
+# Production_Companies lists. Changes made outside this module are not
+# seen until the entry is evicted, expires, or clear_details_cache()
+# is called. In-memory databases are not cached.
 #
-def get_top_N_movies(dbConn, N, min_num_reviews):
+_detailsCache = OrderedDict()     # (dbFile, movie_id) -> (details, expires)
+_detailsCacheStats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+_detailsCacheLock = threading.Lock()
+# Invalidation clock: each invalidation ticks it, and the latest tick
+# per movie is kept (oldest dropped first, at most max_size of them).
+# Loads started before _detailsInvalidatedFloor can't be checked, so
+# they are not cached.
+_detailsClock = 0
+_detailsInvalidated = OrderedDict()   # (dbFile, movie_id) -> tick
+_detailsInvalidatedFloor = 0
+
+# The database file to cache dbConn's details under, or None to skip
+# the cache.
+def _details_cache_file(dbConn):
+    if not DETAILS_CACHE_SETTINGS["enabled"] or datatier.in_transaction(dbConn):
+        return None
+    dbFile = _database_file(dbConn)
+    return dbFile if dbFile != "" else None
+
+# A MovieDetails with its own Genres and Production_Companies lists,
+# so callers can't change what the cache holds.
+def _copy_details(movie):
+    return MovieDetails(movie._movie_id, movie._title, movie._release_date, movie._runtime,
+                        movie._original_language, movie._budget, movie._revenue,
+                        movie._num_reviews, movie._avg_rating, movie._tagline,
+                        list(movie._genres), list(movie._production_companies))
+
+# The invalidation clock, to read before loading details to put.
+def _details_cache_clock():
+    with _detailsCacheLock:
+        return _detailsClock
+
+# Returns {movie_id: MovieDetails} for the ids that are cached.
+def _details_cache_get(dbFile, ids):
+    found = {}
+    now = time.monotonic()
+    with _detailsCacheLock:
+        for movie_id in ids:
+            entry = _detailsCache.get((dbFile, movie_id))
+            if entry is not None and entry[1] is not None and entry[1] <= now:
+                del _detailsCache[(dbFile, movie_id)]
+                _detailsCacheStats["expirations"] += 1
+                entry = None
+            if entry is None:
+                _detailsCacheStats["misses"] += 1
+            else:
+                _detailsCacheStats["hits"] += 1
+                _detailsCache.move_to_end((dbFile, movie_id))
+                found[movie_id] = _copy_details(entry[0])
+    return found
+
+# Caches details loaded from a query started when the clock read
+# loadedAt, skipping movies invalidated since.
+def _details_cache_put(dbFile, details, loadedAt):
+    ttl = DETAILS_CACHE_SETTINGS["ttl"]
+    expires = None if ttl is None else time.monotonic() + ttl
+    with _detailsCacheLock:
+        if loadedAt < _detailsInvalidatedFloor:
+            return
+        for movie_id, movie in details.items():
+            if _detailsInvalidated.get((dbFile, movie_id), -1) > loadedAt:
+                continue
+            _detailsCache[(dbFile, movie_id)] = (_copy_details(movie), expires)
+            _detailsCache.move_to_end((dbFile, movie_id))
+        while len(_detailsCache) > DETAILS_CACHE_SETTINGS["max_size"]:
+            _detailsCache.popitem(last=False)
+            _detailsCacheStats["evictions"] += 1
+
+# Called after a movie is changed through this module. movie_id is
+# whatever the caller passed; if it isn't a whole number the cached
+# movie can't be told apart, so the database's entries are all dropped.
+def _details_cache_invalidate(dbConn, movie_id):
+    global _detailsClock, _detailsInvalidatedFloor
+    dbFile = _database_file(dbConn)
+    if dbFile == "":
+        return
+    key = _movie_key(movie_id)
+    if key is None:
+        datatier.after_transaction(dbConn, lambda: clear_details_cache(dbConn))
+        return
+    movie_id = key
+    with _detailsCacheLock:
+        _detailsClock += 1
+        _detailsInvalidated[(dbFile, movie_id)] = _detailsClock
+        _detailsInvalidated.move_to_end((dbFile, movie_id))
+        while len(_detailsInvalidated) > DETAILS_CACHE_SETTINGS["max_size"]:
+            _detailsInvalidatedFloor = _detailsInvalidated.popitem(last=False)[1]
+        _detailsCache.pop((dbFile, movie_id), None)
+    # Other connections only see the change once the block commits.
+    if datatier.in_transaction(dbConn):
+        datatier.after_transaction(dbConn, lambda: _details_cache_invalidate(dbConn, movie_id))
+
+##################################################################
+#
+# details_cache_stats:
+#
+# Returns a dict with the details cache "hits", "misses", "hit_rate"
+# (0.0 - 1.0), "evictions", "expirations" and current "size".
+#
+def details_cache_stats():
+    with _detailsCacheLock:
+        stats = dict(_detailsCacheStats)
+        stats["size"] = len(_detailsCache)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups > 0 else 0.0
+    return stats
+
+##################################################################
+#
+# clear_details_cache:
+#
+# Drops the cached movie details for dbConn's database, or for every
+# database if dbConn is None. The statistics are kept.
+#
+def clear_details_cache(dbConn=None):
+    global _detailsClock, _detailsInvalidatedFloor
+    dbFile = None if dbConn is None else _database_file(dbConn)
+    with _detailsCacheLock:
+        # Also keep loads already running out of the cache.
+        _detailsClock += 1
+        _detailsInvalidatedFloor = _detailsClock
+        if dbFile is None:
+            _detailsCache.clear()
+        else:
+            for key in [key for key in _detailsCache if key[0] == dbFile]:
+                del _detailsCache[key]
+
+##################################################################
+#
+# warm_details_cache:
+#
+# Loads the details of the given movie IDs into the cache, batch_size
+# IDs per query. IDs beyond the cache's max_size push out earlier ones.
+#
+# Returns: the number of movies found and cached.
+#
+def warm_details_cache(dbConn, ids, batch_size=500):
+    dbFile = _details_cache_file(dbConn)
+    if dbFile is None:
+        return 0
+    ids = list(ids)
+    count = 0
+    for i in range(0, len(ids), batch_size):
+        loadedAt = _details_cache_clock()
+        loaded = _load_movie_details(dbConn, ids[i:i + batch_size])
+        found = {movie.Movie_ID: movie for movie in loaded if movie is not None}
+        _details_cache_put(dbFile, found, loadedAt)
+        count += len(found)
+    return count
+
+
+##################################################################
+#
+# Helper function: _top_N_sql
+#
+# Returns the query behind get_top_N_movies, with parameters
+# (min_num_reviews, N). With Movie_Rating_Stats it reads one row per
+# movie; without it, it groups all of Ratings. Ties on rating and
+# title go by Movie_ID, the same order the top-N cache uses.
+#
+def _top_N_sql(dbConn):
+    if has_rating_stats(dbConn):
+        return ("""
+            SELECT m.Movie_ID, m.Title, substr(m.Release_Date, 1, 4) as Release_Year,
+                   s.Num_Reviews, CAST(s.Sum_Ratings AS REAL) / s.Num_Reviews as Avg_Rating
+            FROM Movie_Rating_Stats s
+            JOIN Movies m ON m.Movie_ID = s.Movie_ID
+            WHERE s.Num_Reviews >= ? AND s.Num_Reviews > 0
+            ORDER BY Avg_Rating DESC, m.Title ASC, m.Movie_ID ASC
+            LIMIT ?
+        """)
     # SQL: join Movies and Ratings, group by movie, and filter by minimum reviews.
-    sql = ("""
+    return ("""
         SELECT m.Movie_ID, m.Title, substr(m.Release_Date, 1, 4) as Release_Year,
                COUNT(r.Rating) as Num_Reviews, AVG(r.Rating) as Avg_Rating
         FROM Movies m
         JOIN Ratings r ON m.Movie_ID = r.Movie_ID
         GROUP BY m.Movie_ID
         HAVING COUNT(r.Rating) >= ?
-        ORDER BY Avg_Rating DESC, m.Title ASC
+        ORDER BY Avg_Rating DESC, m.Title ASC, m.Movie_ID ASC
         LIMIT ?
     """)
-    rows = datatier.select_n_rows(dbConn, sql, [min_num_reviews, N])
-    movies = []
-    if rows is None:
+
+##################################################################
+#
+# get_top_N_movies:
+#
+# Finds and returns the top N movies based on their average
+# rating, where each movie has at least the specified number of reviews.
+# Answered from the top-N cache when it is enabled (see below).
+#
+def get_top_N_movies(dbConn, N, min_num_reviews):
+    if TOP_N_CACHE_SETTINGS["enabled"]:
+        movies = _cached_top_N(dbConn, N, min_num_reviews)
+        if movies is not None:
+            return movies
+    sql = _top_N_sql(dbConn)
+    # Each row comes back as a MovieRating object.
+    movies = datatier.select_n_rows(dbConn, sql, [min_num_reviews, N],
+                                    row_factory=_movie_rating_row)
+    if movies is None:
         return []
-    # Create a MovieRating object for each row.
-    for row in rows:
-        movie_rating = MovieRating(row[0], row[1], row[2], row[3], row[4])
-        movies.append(movie_rating)
     return movies
 
+##################################################################
+#
+# iter_top_N_movies:
+#
+# Lazy version of get_top_N_movies: yields the MovieRating objects one
+# at a time, best first. Yields nothing if an error occurs.
+#
+def iter_top_N_movies(dbConn, N, min_num_reviews, batch_size=datatier.DEFAULT_FETCH_SIZE):
+    sql = _top_N_sql(dbConn)
+    movies = datatier.select_iter(dbConn, sql, [min_num_reviews, N], batch_size,
+                                  row_factory=_movie_rating_row)
+    if movies is None:
+        return
+    yield from movies
+
+##################################################################
+#
+# Top-N cache:
+#
+# For each database file, keeps every rated movie's review count and
+# rating sum in memory, and for each min_num_reviews asked for, the
+# movies with at least that many reviews as a sorted list in
+# get_top_N_movies order. get_top_N_movies then just slices a list.
+#
+# add_review updates the cache in place: the movie's totals change and
+# it moves to its new place in each ranking (or joins one it now
+# qualifies for). Writes the cache can't follow one by one -- add_reviews,
+# reviews added inside a datatier.transaction() that might still roll
+# back -- clear that database's cache instead, and it is reloaded on
+# the next read. While a write is in progress the cache is not
+# reloaded, so a load can never miss a review that is then not added
+# to it.
+#
+# Before serving, the cache checks Rating_Stats_Version, which the
+# Movie_Rating_Stats triggers bump on every change to Ratings: if it
+# moved on by more than this module's own writes (another program,
+# another connection, raw SQL), the cache is reloaded. So only
+# databases with Movie_Rating_Stats (see create_rating_stats), or
+# opened by a read-only pool, are cached; in-memory databases are not
+# cached either.
+#
+class _TopNCache:
+    def __init__(self, totals, version):
+        # movie_id -> [num_reviews, sum_ratings, title, release_year]
+        self.totals = totals
+        # Rating_Stats_Version the totals match
+        self.version = version
+        # min_num_reviews -> sorted list of _rank_key()s
+        self.rankings = OrderedDict()
+        # movie_id -> MovieRating, built when a movie's totals change
+        self.movies = {}
+        self.lock = threading.Lock()
+
+    def movie(self, movie_id):
+        movie = self.movies.get(movie_id)
+        if movie is None:
+            num, total, title, year = self.totals[movie_id]
+            movie = MovieRating(movie_id, title, year, num, total / num)
+            self.movies[movie_id] = movie
+        return movie
+
+    def ranking(self, threshold):
+        ranked = self.rankings.get(threshold)
+        if ranked is None:
+            ranked = sorted(_rank_key(movie_id, *entry)
+                            for movie_id, entry in self.totals.items()
+                            if entry[0] >= threshold)
+            self.rankings[threshold] = ranked
+            if len(self.rankings) > TOP_N_CACHE_SETTINGS["max_thresholds"]:
+                self.rankings.popitem(last=False)
+        else:
+            self.rankings.move_to_end(threshold)
+        return ranked
+
+    def add(self, movie_id, rating, title, year):
+        entry = self.totals.get(movie_id)
+        if entry is None:
+            entry = [0, 0, title, year]
+            self.totals[movie_id] = entry
+        oldCount = entry[0]
+        oldKey = _rank_key(movie_id, *entry) if oldCount > 0 else None
+        entry[0] += 1
+        entry[1] += rating
+        # The insert bumped Rating_Stats_Version once.
+        self.version += 1
+        newKey = _rank_key(movie_id, *entry)
+        self.movies.pop(movie_id, None)
+        for threshold, ranked in self.rankings.items():
+            if oldKey is not None and oldCount >= threshold:
+                del ranked[bisect.bisect_left(ranked, oldKey)]
+            if entry[0] >= threshold:
+                bisect.insort(ranked, newKey)
+
+_topNCaches = {}
+# dbFile -> [generation, writes in progress]; every write through this
+# module bumps the generation when it starts and when it ends
+_topNWrites = {}
+_topNCachesLock = threading.Lock()
+
+# Sort key matching ORDER BY Avg_Rating DESC, Title ASC, Movie_ID ASC
+# (SQL puts NULL titles first).
+def _rank_key(movie_id, num, total, title, year):
+    return (-(total / num), title is not None, title or "", movie_id)
+
+# The file behind dbConn's main database, or "" if it is in memory.
+# Remembered for the connection or pool (see datatier.database_info).
+def _database_file(dbConn):
+    info = datatier.database_info(dbConn)
+    dbFile = info.get("file")
+    if dbFile is None:
+        row = datatier.select_one_row(dbConn, "PRAGMA database_list")
+        if not row:
+            return ""
+        dbFile = row[2]
+        info["file"] = dbFile
+    return dbFile
+
+# The database's Rating_Stats_Version, or None if it has none (or an
+# error occurs). A read-only pool's database can't change, so without
+# one it is always 0.
+def _rating_stats_version(dbConn):
+    if not has_rating_stats(dbConn):
+        if isinstance(dbConn, datatier.ConnectionPool) and dbConn.Mode == "readonly":
+            return 0
+        return None
+    row = datatier.select_one_row(dbConn, "SELECT Version FROM Rating_Stats_Version")
+    if not row:
+        return None
+    return row[0]
+
+# A cache is only built while no write is in progress, and is thrown
+# away if one started or ended while it was loading: the load may or
+# may not have seen that write, so it can't be patched up. That call
+# (and any inside a transaction(), whose reads may be out of date or
+# not yet committed) is answered by the query instead. While one of
+# this module's writes is in progress the cache is served as is; it
+# catches up when the write ends.
+def _cached_top_N(dbConn, N, min_num_reviews):
+    dbFile = _database_file(dbConn)
+    if dbFile == "":
+        return None
+    with _topNCachesLock:
+        cache = _topNCaches.get(dbFile)
+        writes = _topNWrites.setdefault(dbFile, [0, 0])
+        generation, busy = writes
+    if cache is not None and not busy:
+        version = _rating_stats_version(dbConn)
+        with cache.lock:
+            current = cache.version == version
+        if not current:
+            if datatier.in_transaction(dbConn):
+                return None
+            # Written to from elsewhere: reload.
+            with _topNCachesLock:
+                if writes[0] == generation and _topNCaches.get(dbFile) is cache:
+                    del _topNCaches[dbFile]
+            cache = None
+    if cache is None:
+        if busy or datatier.in_transaction(dbConn):
+            return None
+        version = _rating_stats_version(dbConn)
+        if version is None:
+            return None
+        if has_rating_stats(dbConn):
+            sql = ("SELECT s.Movie_ID, s.Num_Reviews, s.Sum_Ratings, m.Title, "
+                   "substr(m.Release_Date, 1, 4) FROM Movie_Rating_Stats s "
+                   "JOIN Movies m ON m.Movie_ID = s.Movie_ID WHERE s.Num_Reviews > 0")
+        else:
+            sql = ("SELECT m.Movie_ID, COUNT(r.Rating), SUM(r.Rating), m.Title, "
+                   "substr(m.Release_Date, 1, 4) FROM Movies m "
+                   "JOIN Ratings r ON m.Movie_ID = r.Movie_ID "
+                   "GROUP BY m.Movie_ID HAVING COUNT(r.Rating) > 0")
+        rows = datatier.select_n_rows(dbConn, sql)
+        # A change between the two reads may or may not be in rows.
+        if rows is None or _rating_stats_version(dbConn) != version:
+            return None
+        cache = _TopNCache({row[0]: list(row[1:]) for row in rows}, version)
+        with _topNCachesLock:
+            if writes[0] != generation:
+                return None
+            cache = _topNCaches.setdefault(dbFile, cache)
+
+    with cache.lock:
+        ranked = cache.ranking(max(min_num_reviews, 1))
+        # LIMIT with a negative N means no limit.
+        if N >= 0:
+            ranked = ranked[:N]
+        return [cache.movie(key[-1]) for key in ranked]
+
+# Called before reviews are added through this module. Returns the
+# database file to pass to _top_N_write_end.
+def _top_N_write_begin(dbConn):
+    dbFile = _database_file(dbConn)
+    if dbFile != "":
+        with _topNCachesLock:
+            writes = _topNWrites.setdefault(dbFile, [0, 0])
+            writes[0] += 1
+            writes[1] += 1
+    return dbFile
+
+# Called after the write: adds the review (movie_id, rating) to the
+# cache (nothing changed if rating is None), or with no movie_id drops
+# the cache, for writes it can't follow one by one. Inside a
+# transaction() a change drops the cache, and the write counts as in
+# progress until the block ends, since it may still roll back.
+def _top_N_write_end(dbConn, dbFile, movie_id=None, rating=None):
+    if dbFile == "":
+        return
+    changed = movie_id is None or rating is not None
+    if changed and datatier.in_transaction(dbConn):
+        with _topNCachesLock:
+            _topNCaches.pop(dbFile, None)
+        datatier.after_transaction(dbConn, lambda: _top_N_write_end(dbConn, dbFile))
+        return
+    try:
+        with _topNCachesLock:
+            cache = _topNCaches.get(dbFile)
+            if cache is not None and movie_id is None:
+                del _topNCaches[dbFile]
+                cache = None
+        if cache is None or rating is None:
+            return
+        if isinstance(rating, bool) or not isinstance(rating, (int, float)) or rating != rating:
+            # Stored as SQLite converts it ("7" -> 7, NaN -> NULL), which
+            # the cache doesn't try to copy.
+            raise TypeError("rating is not a number")
+        with cache.lock:
+            entry = cache.totals.get(_movie_key(movie_id))
+            if entry is not None:
+                cache.add(_movie_key(movie_id), rating, entry[2], entry[3])
+                return
+        # Title and year, for a movie the cache hasn't seen reviewed before.
+        sql = "SELECT Movie_ID, Title, substr(Release_Date, 1, 4) FROM Movies WHERE Movie_ID = ?"
+        row = datatier.select_one_row(dbConn, sql, [movie_id])
+        if not row:
+            raise LookupError("movie not found")
+        with cache.lock:
+            cache.add(row[0], rating, row[1], row[2])
+    except Exception:
+        # The review is written either way; a cache that can't follow
+        # it is dropped rather than failing the write.
+        with _topNCachesLock:
+            _topNCaches.pop(dbFile, None)
+    finally:
+        with _topNCachesLock:
+            writes = _topNWrites[dbFile]
+            writes[0] += 1
+            writes[1] -= 1
+
+##################################################################
+#
+# clear_top_N_cache:
+#
+# Drops the cached top-N rankings for dbConn's database, or for every
+# database if dbConn is None.
+#
+def clear_top_N_cache(dbConn=None):
+    dbFile = None if dbConn is None else _database_file(dbConn)
+    with _topNCachesLock:
+        # Also discard any cache still being loaded.
+        for key, writes in _topNWrites.items():
+            if dbFile is None or key == dbFile:
+                writes[0] += 1
+        if dbFile is None:
+            _topNCaches.clear()
+        else:
+            _topNCaches.pop(dbFile, None)
+
 ##################################################################
 #
 # add_review:
 #
 # Inserts the given review (a rating between 0 and 10) into
-# the database for the given movie.
+# the database for the given movie. Inside a datatier.transaction()
+# block it is committed with the block.
+#
+# Returns: 1 if the review was added, 0 if there is no such movie or
+#          an error occurs.
 #
 def add_review(dbConn, movie_id, rating):
-    # Verify movie exists.
-    sql_check = "SELECT Movie_ID FROM Movies WHERE Movie_ID = ?"
-    movie_row = datatier.select_one_row(dbConn, sql_check, [movie_id])
-    if movie_row is None or movie_row == ():
-        return 0
-    # Insert the review.
-    sql_insert = "INSERT INTO Ratings (Movie_ID, Rating) VALUES (?, ?)"
-    result = datatier.perform_action(dbConn, sql_insert, [movie_id, rating])
-    return 1 if result and result > 0 else 0
+    # Insert the review only if the movie exists, in one statement, so
+    # there is no window between the check and the insert.
+    sql_insert = ("INSERT INTO Ratings (Movie_ID, Rating) "
+                  "SELECT ?, ? WHERE EXISTS (SELECT 1 FROM Movies WHERE Movie_ID = ?)")
+    dbFile = _top_N_write_begin(dbConn)
+    result = datatier.perform_action(dbConn, sql_insert, [movie_id, rating, movie_id])
+    added = result is not None and result > 0
+    _top_N_write_end(dbConn, dbFile, movie_id, rating if added else None)
+    if added:
+        _details_cache_invalidate(dbConn, movie_id)
+        return 1
+    return 0
+
+##################################################################
+#
+# add_reviews:
+#
+# Bulk version of add_review: inserts each (movie_id, rating) pair in
+# reviews, batch_size rows per transaction. Reviews for movies that
+# are not in the database are skipped.
+#
+# Returns: the number of reviews inserted, or -1 if an error occurs.
+#
+def add_reviews(dbConn, reviews, batch_size=datatier.DEFAULT_COMMIT_SIZE):
+    # The existence check is part of the insert, so each review is one row.
+    sql = ("INSERT INTO Ratings (Movie_ID, Rating) "
+           "SELECT ?, ? WHERE EXISTS (SELECT 1 FROM Movies WHERE Movie_ID = ?)")
+    params = ((movie_id, rating, movie_id) for movie_id, rating in reviews)
+    dbFile = _top_N_write_begin(dbConn)
+    try:
+        result = datatier.perform_many(dbConn, sql, params, batch_size)
+    finally:
+        # Batches may have been committed even if a later one failed.
+        _top_N_write_end(dbConn, dbFile)
+    datatier.after_transaction(dbConn, lambda: clear_details_cache(dbConn))
+    return result
 
 ##################################################################
 #
 # set_tagline:
 #
-# Sets (or deletes) the tagline for the given movie.
+# Sets (or deletes) the tagline for the given movie. Inside a
+# datatier.transaction() block it is committed with the block.
+#
+# Returns: 1 if the movie exists and its tagline is now as given
+#          (an empty tagline means none), 0 if there is no such movie
+#          or an error occurs.
 #
 def set_tagline(dbConn, movie_id, tagline):
-    # Verify movie exists.
-    sql_check = "SELECT Movie_ID FROM Movies WHERE Movie_ID = ?"
-    movie_row = datatier.select_one_row(dbConn, sql_check, [movie_id])
-    if movie_row is None or movie_row == ():
-        return 0
-    # Check for an existing tagline.
-    sql_existing = "SELECT Tagline FROM Movie_Taglines WHERE Movie_ID = ?"
-    existing_row = datatier.select_one_row(dbConn, sql_existing, [movie_id])
-    if existing_row and existing_row != ():
-        # If a tagline exists, update it if non-empty, or delete if empty.
-        if tagline != "":
-            sql_update = "UPDATE Movie_Taglines SET Tagline = ? WHERE Movie_ID = ?"
-            result = datatier.perform_action(dbConn, sql_update, [tagline, movie_id])
-        else:
-            sql_delete = "DELETE FROM Movie_Taglines WHERE Movie_ID = ?"
-            result = datatier.perform_action(dbConn, sql_delete, [movie_id])
+    if tagline != "":
+        # Insert or replace the tagline, only if the movie exists, in one
+        # statement (Movie_ID is the key of Movie_Taglines).
+        sql_upsert = ("INSERT INTO Movie_Taglines (Movie_ID, Tagline) "
+                      "SELECT ?, ? WHERE EXISTS (SELECT 1 FROM Movies WHERE Movie_ID = ?) "
+                      "ON CONFLICT (Movie_ID) DO UPDATE SET Tagline = excluded.Tagline")
+        result = datatier.perform_action(dbConn, sql_upsert, [movie_id, tagline, movie_id])
     else:
-        # If no tagline exists, insert one if non-empty.
-        if tagline != "":
-            sql_insert = "INSERT INTO Movie_Taglines (Movie_ID, Tagline) VALUES (?, ?)"
-            result = datatier.perform_action(dbConn, sql_insert, [movie_id, tagline])
-        else:
-            result = 1  # Nothing to do if tagline is empty and none exists.
+        # Delete the tagline if there is one.
+        sql_delete = "DELETE FROM Movie_Taglines WHERE Movie_ID = ?"
+        result = datatier.perform_action(dbConn, sql_delete, [movie_id])
+        if result == 0:
+            # Nothing to delete: succeed if the movie exists.
+            sql_check = "SELECT Movie_ID FROM Movies WHERE Movie_ID = ?"
+            movie_row = datatier.select_one_row(dbConn, sql_check, [movie_id])
+            result = 1 if movie_row else 0
+    _details_cache_invalidate(dbConn, movie_id)
     return 1 if result and result > 0 else 0
+
+##################################################################
+#
+# Movie_Rating_Stats:
+#
+# Per-movie review count and rating sum, so that get_top_N_movies and
+# get_movie_details don't have to aggregate Ratings on every call.
+# Triggers on Ratings keep it current however reviews are added,
+# changed or removed. Only non-NULL ratings are counted.
+# Rating_Stats_Version is one row the triggers bump on each change,
+# so the top-N cache can tell when it is out of date.
+#
+_SQL_RATING_STATS = [
+    "DROP TRIGGER IF EXISTS Ratings_Stats_Insert",
+    "DROP TRIGGER IF EXISTS Ratings_Stats_Delete",
+    "DROP TRIGGER IF EXISTS Ratings_Stats_Update",
+    "DROP TABLE IF EXISTS Movie_Rating_Stats",
+    "DROP TABLE IF EXISTS Rating_Stats_Version",
+    "CREATE TABLE Rating_Stats_Version (Version INTEGER NOT NULL)",
+    "INSERT INTO Rating_Stats_Version (Version) VALUES (0)",
+    """
+    CREATE TABLE Movie_Rating_Stats (
+        Movie_ID INTEGER PRIMARY KEY,
+        Num_Reviews INTEGER NOT NULL,
+        Sum_Ratings INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """,
+    """
+    INSERT INTO Movie_Rating_Stats (Movie_ID, Num_Reviews, Sum_Ratings)
+    SELECT Movie_ID, COUNT(Rating), SUM(Rating) FROM Ratings
+    WHERE Rating IS NOT NULL
+    GROUP BY Movie_ID
+    """,
+    "CREATE INDEX Movie_Rating_Stats_Num_Reviews ON Movie_Rating_Stats (Num_Reviews)",
+    """
+    CREATE TRIGGER Ratings_Stats_Insert AFTER INSERT ON Ratings
+    WHEN NEW.Rating IS NOT NULL
+    BEGIN
+        INSERT INTO Movie_Rating_Stats (Movie_ID, Num_Reviews, Sum_Ratings)
+        VALUES (NEW.Movie_ID, 1, NEW.Rating)
+        ON CONFLICT (Movie_ID) DO UPDATE
+        SET Num_Reviews = Num_Reviews + 1, Sum_Ratings = Sum_Ratings + excluded.Sum_Ratings;
+        UPDATE Rating_Stats_Version SET Version = Version + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER Ratings_Stats_Delete AFTER DELETE ON Ratings
+    WHEN OLD.Rating IS NOT NULL
+    BEGIN
+        UPDATE Movie_Rating_Stats
+        SET Num_Reviews = Num_Reviews - 1, Sum_Ratings = Sum_Ratings - OLD.Rating
+        WHERE Movie_ID = OLD.Movie_ID;
+        UPDATE Rating_Stats_Version SET Version = Version + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER Ratings_Stats_Update AFTER UPDATE OF Movie_ID, Rating ON Ratings
+    BEGIN
+        UPDATE Movie_Rating_Stats
+        SET Num_Reviews = Num_Reviews - 1, Sum_Ratings = Sum_Ratings - OLD.Rating
+        WHERE Movie_ID = OLD.Movie_ID AND OLD.Rating IS NOT NULL;
+        INSERT INTO Movie_Rating_Stats (Movie_ID, Num_Reviews, Sum_Ratings)
+        SELECT NEW.Movie_ID, 1, NEW.Rating WHERE NEW.Rating IS NOT NULL
+        ON CONFLICT (Movie_ID) DO UPDATE
+        SET Num_Reviews = Num_Reviews + 1, Sum_Ratings = Sum_Ratings + excluded.Sum_Ratings;
+        UPDATE Rating_Stats_Version SET Version = Version + 1;
+    END
+    """,
+]
+
+##################################################################
+#
+# has_rating_stats:
+#
+# Returns True if the database has the Movie_Rating_Stats and
+# Rating_Stats_Version tables (one built before Rating_Stats_Version
+# existed is rebuilt by create_rating_stats). The answer is remembered for the connection or pool (see
+# datatier.database_info) and rechecked after rebuild_rating_stats;
+# if the table is created or dropped some other way, use a new pool.
+#
+def has_rating_stats(dbConn):
+    info = datatier.database_info(dbConn)
+    found = info.get("rating_stats")
+    if found is None:
+        sql = ("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' "
+               "AND name IN ('Movie_Rating_Stats', 'Rating_Stats_Version')")
+        row = datatier.select_one_row(dbConn, sql)
+        if not row:
+            return False
+        found = row[0] == 2
+        # What a transaction sees may yet be rolled back.
+        if not datatier.in_transaction(dbConn):
+            info["rating_stats"] = found
+    return found
+
+##################################################################
+#
+# rebuild_rating_stats:
+#
+# (Re)creates Movie_Rating_Stats from Ratings, along with the triggers
+# that keep it current, in one transaction.
+#
+# Returns: True, or False if an error occurs.
+#
+def rebuild_rating_stats(dbConn):
+    try:
+        with datatier.transaction(dbConn) as conn:
+            for sql in _SQL_RATING_STATS:
+                conn.execute(sql)
+    except Exception as e:
+        print("rebuild_rating_stats failed:", e)
+        return False
+    finally:
+        datatier.database_info(dbConn).pop("rating_stats", None)
+        # Rating_Stats_Version starts over from 0.
+        clear_top_N_cache(dbConn)
+    return True
+
+##################################################################
+#
+# create_rating_stats:
+#
+# Builds Movie_Rating_Stats if the database has a Ratings table but
+# no Movie_Rating_Stats (or Rating_Stats_Version) yet.
+#
+# Returns: True if the table is there afterwards, otherwise False.
+#
+def create_rating_stats(dbConn):
+    if has_rating_stats(dbConn):
+        return True
+    sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Ratings'"
+    row = datatier.select_one_row(dbConn, sql)
+    if row is None or row == ():
+        return False
+    return rebuild_rating_stats(dbConn)
+
+##################################################################
+#
+# Title search:
+#
+# Title LIKE ? can't use an ordinary index (LIKE ignores ASCII case)
+# and a leading % rules out any index, so every search would scan
+# Movies. create_title_search adds
+#   Movies_Title_Lower  an index on lower(Title), which folds ASCII
+#                       case the way LIKE does, for patterns that start
+#                       with literal text: "star wars%" becomes the range
+#                       lower(Title) >= 'star wars' AND < 'star wart'
+#   Movies_Search       an FTS5 trigram index of Title, kept current by
+#                       triggers, for patterns with 3 or more literal
+#                       characters in a row anywhere ("%the k_ng%")
+# Either way Title LIKE ? is still checked on each candidate row, so
+# the matches are exactly LIKE's.
+#
+_SQL_TITLE_SEARCH = [
+    "CREATE INDEX IF NOT EXISTS Movies_Title_Lower ON Movies (lower(Title))",
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS Movies_Search
+    USING fts5(Title, content='Movies', content_rowid='Movie_ID', tokenize='trigram')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS Movies_Search_Insert AFTER INSERT ON Movies BEGIN
+        INSERT INTO Movies_Search (rowid, Title) VALUES (new.Movie_ID, new.Title);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS Movies_Search_Delete AFTER DELETE ON Movies BEGIN
+        INSERT INTO Movies_Search (Movies_Search, rowid, Title)
+        VALUES ('delete', old.Movie_ID, old.Title);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS Movies_Search_Update AFTER UPDATE OF Movie_ID, Title ON Movies BEGIN
+        INSERT INTO Movies_Search (Movies_Search, rowid, Title)
+        VALUES ('delete', old.Movie_ID, old.Title);
+        INSERT INTO Movies_Search (rowid, Title) VALUES (new.Movie_ID, new.Title);
+    END
+    """,
+    "INSERT INTO Movies_Search (Movies_Search) VALUES ('rebuild')",
+]
+
+# lower() and LIKE only fold ASCII letters.
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+##################################################################
+#
+# has_title_search:
+#
+# Returns True if the database has the Movies_Search index. Like
+# has_rating_stats, the answer is remembered for the connection or
+# pool, and rechecked after create_title_search.
+#
+def has_title_search(dbConn):
+    info = datatier.database_info(dbConn)
+    found = info.get("title_search")
+    if found is None:
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Movies_Search'"
+        row = datatier.select_one_row(dbConn, sql)
+        if row is None:
+            return False
+        found = row != ()
+        if not datatier.in_transaction(dbConn):
+            info["title_search"] = found
+    return found
+
+##################################################################
+#
+# create_title_search:
+#
+# Builds the title search indexes if the database has a Movies table
+# but no Movies_Search yet, in one transaction.
+#
+# Returns: True if they are there afterwards, otherwise False (for
+#          example, an SQLite built without FTS5).
+#
+def create_title_search(dbConn):
+    if has_title_search(dbConn):
+        return True
+    sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Movies'"
+    row = datatier.select_one_row(dbConn, sql)
+    if row is None or row == ():
+        return False
+    try:
+        with datatier.transaction(dbConn) as conn:
+            for sql in _SQL_TITLE_SEARCH:
+                conn.execute(sql)
+    except Exception as e:
+        print("create_title_search failed:", e)
+        return False
+    finally:
+        datatier.database_info(dbConn).pop("title_search", None)
+    return True
+
+# True if pattern has 3 or more non-wildcard characters in a row,
+# the least the trigram index can search for.
+def _has_trigram(pattern):
+    run = 0
+    for ch in pattern:
+        if ch == '%' or ch == '_':
+            run = 0
+        else:
+            run += 1
+            if run >= 3:
+                return True
+    return False
+
+##################################################################
+#
+# Helper function: _title_predicate
+#
+# Returns (sql, parameters) for a WHERE condition on Movies equivalent
+# to "Title LIKE pattern", narrowed by the title search indexes when
+# the pattern allows:
+#   no wildcards, or literal text then only %  ->  lower(Title) range
+#   3+ literal characters in a row (with FTS5)  ->  Movies_Search
+#   other patterns starting with literal text   ->  lower(Title) range
+#   anything else                               ->  Title LIKE ? alone
+#
+def _title_predicate(dbConn, pattern):
+    if not isinstance(pattern, str):
+        return ("Title LIKE ?", [pattern])
+    literal = len(pattern)
+    for i, ch in enumerate(pattern):
+        if ch == '%' or ch == '_':
+            literal = i
+            break
+    prefix = pattern[:literal]
+    prefixOnly = pattern[literal:].strip("%") == ""
+
+    if not prefixOnly and _has_trigram(pattern) and has_title_search(dbConn):
+        sql = ("Movie_ID IN (SELECT rowid FROM Movies_Search WHERE Title LIKE ?) "
+               "AND Title LIKE ?")
+        return (sql, [pattern, pattern])
+
+    if prefix != "":
+        low = prefix.translate(_ASCII_LOWER)
+        if literal == len(pattern):
+            return ("lower(Title) = ? AND Title LIKE ?", [low, pattern])
+        # Smallest string above everything starting with low: bump the
+        # last character (UTF-8 byte order is code point order).
+        last = ord(low[-1])
+        if last != 0x10FFFF and last + 1 != 0xD800:
+            high = low[:-1] + chr(last + 1)
+            return ("lower(Title) >= ? AND lower(Title) < ? AND Title LIKE ?",
+                    [low, high, pattern])
+
+    return ("Title LIKE ?", [pattern])
@@ -4,7 +4,18 @@
 # This application allows you to analyze various aspects of the MovieLens database.
 # All database queries are made through the object mapping tier (objecttier).
 
-import sqlite3
+# Usage:
+#   python MovieDatabaseApp.py             read and write the database file
+#   python MovieDatabaseApp.py --readonly  open the file read-only, memory-mapped
+#   python MovieDatabaseApp.py --memory    copy the database into memory first
+#   python MovieDatabaseApp.py --rebuild-stats
+#                                          rebuild Movie_Rating_Stats at startup
+#   python MovieDatabaseApp.py --warm ids.txt
+#                                          preload details of the movie IDs in
+#                                          ids.txt (one per line)
+
+import argparse
+import datatier
 import objecttier
 
 
@@ -32,8 +43,12 @@ def command_print_stats(dbConn):
 # Command 2: Find movies matching a pattern.
 def command_find_movies(dbConn):
     pattern = input("Enter the name of the movie to find (wildcards _ and % allowed): ")
-    movies = objecttier.get_movies(dbConn, pattern)
-    count = len(movies)
+    # Count first: the movies themselves are only fetched if there
+    # are few enough to display.
+    count = max(objecttier.count_movies(dbConn, pattern), 0)
+    movies = []
+    if 0 < count <= 100:
+        movies = objecttier.get_movies(dbConn, pattern, limit=100)
     print()
     print("Number of Movies Found: {}".format(count))
     
@@ -118,6 +133,9 @@ def command_top_movies(dbConn):
 
 # Command 5: Add a new review for a movie.
 def command_add_review(dbConn):
+    if dbConn.Mode == "readonly":
+        print("The database was opened read-only; reviews cannot be added.")
+        return
     try:
         rating = int(input("Enter a value for the new rating (0-10): "))
     except ValueError:
@@ -143,6 +161,9 @@ def command_add_review(dbConn):
 
 # Command 6: Set the tagline for a movie.
 def command_set_tagline(dbConn):
+    if dbConn.Mode == "readonly":
+        print("The database was opened read-only; taglines cannot be set.")
+        return
     tagline = input("Enter a tagline: ")
     try:
         movie_id = int(input("Enter a movie ID: "))
@@ -159,6 +180,18 @@ def command_set_tagline(dbConn):
 
 
 # Main Program Execution
+parser = argparse.ArgumentParser(description="Movie Database App")
+modeGroup = parser.add_mutually_exclusive_group()
+modeGroup.add_argument("--readonly", action="store_const", dest="mode", const="readonly",
+                       help="open the database read-only, memory-mapped")
+modeGroup.add_argument("--memory", action="store_const", dest="mode", const="memory",
+                       help="copy the database into memory at startup (changes are not saved)")
+parser.add_argument("--rebuild-stats", action="store_true",
+                    help="rebuild the per-movie rating statistics from Ratings")
+parser.add_argument("--warm", metavar="FILE",
+                    help="preload the details of the movie IDs in FILE, one per line")
+args = parser.parse_args()
+
 print("Project 2: Movie Database App (N-Tier)")
 print("CS 341, Spring 2025")
 print()
@@ -169,13 +202,35 @@ print()
 # Get the database name from the user.
 dbName = input("Enter the name of the database you would like to use: ")
 
-# Connect to the SQLite database.
+# Connect to the SQLite database. The pool is used wherever a
+# connection is expected and opens one connection per thread.
 try:
-    dbConn = sqlite3.connect(dbName)
+    dbConn = datatier.ConnectionPool(dbName, args.mode or "readwrite")
 except Exception as e:
     print("Failed to connect to the database:", e)
     exit()
 
+# Per-movie rating statistics and title search indexes, kept current
+# by triggers once built. A read-only database is used as it is.
+if args.rebuild_stats:
+    if objecttier.rebuild_rating_stats(dbConn):
+        print("Rating statistics rebuilt.")
+elif dbConn.Mode != "readonly":
+    objecttier.create_rating_stats(dbConn)
+if dbConn.Mode != "readonly":
+    objecttier.create_title_search(dbConn)
+
+# Preload the movie details cache.
+if args.warm is not None:
+    try:
+        with open(args.warm) as idFile:
+            warmIDs = [int(line) for line in idFile if line.strip() != ""]
+    except (OSError, ValueError) as e:
+        print("Failed to read movie IDs to preload:", e)
+    else:
+        count = objecttier.warm_details_cache(dbConn, warmIDs)
+        print("Preloaded details of {} movies.".format(format(count, ",")))
+
 print()
 print("Successfully connected to the database!")
 print()